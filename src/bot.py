@@ -26,6 +26,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from odmantic import AIOEngine
 
 from src.utils.utils import main_embed
+from src.utils.storage import ContentCache, FileTreeCache
 from .HIDDEN import TOKEN, MONGO_URI
 
 REMOVE_WORDS = [
@@ -53,6 +54,8 @@ class Jarvide(Bot):
             intents=Intents.all(),
         )
         self.engine = AIOEngine(AsyncIOMotorClient(MONGO_URI))
+        self.file_trees = FileTreeCache(self.engine)
+        self.file_contents = ContentCache()
         self.send_guild = None
         self.error_channel = None
         self.server_message = None
@@ -6,7 +6,17 @@ from argparse import ArgumentParser
 from disnake.ext import commands
 from typing import TYPE_CHECKING, Literal
 
-from src.utils.utils import EmbedFactory, ExitButton, SaveButton, add_lines, get_info
+from src.utils.diff import DiffTimeout, diff_in_thread
+from src.utils.outline import PYTHON_EXTENSIONS, Symbol
+from src.utils.paginator import LinePaginator, PageIndex
+from src.utils.utils import (
+    EmbedFactory,
+    ExitButton,
+    SaveButton,
+    add_lines,
+    escape_codeblock,
+    get_info,
+)
 
 if TYPE_CHECKING:
     from src.utils import File
@@ -40,19 +50,18 @@ class OptionSelect(disnake.ui.Select):
         self,
         ctx: commands.Context,
         file: File,
-        pages: list[str],
         bot_message: disnake.Message,
         parent: EditView,
     ):
         super().__init__()
         self.ctx = ctx
         self.bot_message = bot_message
-        self.pages = pages
         self.file = file
         self.parent = parent
         self.options = [
             disnake.SelectOption(value="1", label="Find"),
             disnake.SelectOption(value="2", label="Go to page..."),
+            disnake.SelectOption(value="3", label="Go to symbol..."),
         ]
 
     @staticmethod
@@ -88,14 +97,12 @@ class OptionSelect(disnake.ui.Select):
                 await self.parent.refresh_message(self.parent.page)
                 return await self.ctx.send(f"Replaced all `{content}` occurrences with `{''.join(args.replace)}`!")
 
-        try:
-            page_occurrence = [
-                i for i, c in enumerate(self.pages) if any([content in li for li in c])
-            ]
-        except IndexError:
-            return await self.ctx.send("No occurrence found!")
         lines = self.file.content.splitlines()
         line_occurrence = [i for i, c in enumerate(lines) if content in c]
+        if not line_occurrence:
+            return await self.ctx.send("No occurrence found!")
+        layout = self.parent.layout
+        page_occurrence = {layout.page_of(i) for i in line_occurrence}
         current_line = 0
         await self.ctx.send(
             f"Found {self.file.content.count(content)} occurrence of `{content}` "
@@ -124,12 +131,12 @@ class OptionSelect(disnake.ui.Select):
             else:
                 await self.ctx.send("Exited!", delete_after=10)
                 break
-            self.parent.page = line_occurrence[current_line] // 50
+            self.parent.page = self.parent.layout.page_of(line_occurrence[current_line])
             await self.ctx.send(
                 f"Found occurrence in line {line_occurrence[current_line] + 1}!",
                 delete_after=10,
             )
-            await self.parent.refresh_message(line_occurrence[current_line] // 50)
+            await self.parent.refresh_message(self.parent.page)
             await message.delete()
 
     async def goto_option(self, interaction: disnake.MessageInteraction):
@@ -145,7 +152,7 @@ class OptionSelect(disnake.ui.Select):
             return await self.ctx.send(
                 "Not a digit, operation is cancelled.", delete_after=10
             )
-        elif len(self.pages) < int(content) < 1:
+        elif not 1 <= int(content) <= self.parent.layout.page_count:
             return await self.ctx.send(
                 "You cannot enter a number below 1 or above "
                 "number of pages, operation is cancelled.",
@@ -154,6 +161,31 @@ class OptionSelect(disnake.ui.Select):
         self.parent.page = int(content) - 1
         await self.parent.refresh_message(self.parent.page)
 
+    async def symbol_option(self, interaction: disnake.MessageInteraction):
+        if self.file.extension not in PYTHON_EXTENSIONS:
+            return await interaction.response.send_message(
+                "Only Python files have an outline!", ephemeral=True
+            )
+        try:
+            symbols = await self.file.symbols()
+        except SyntaxError as e:
+            return await interaction.response.send_message(
+                f"Can't outline this file, line {e.lineno} has a syntax error: {e.msg}",
+                ephemeral=True,
+            )
+        if not symbols:
+            return await interaction.response.send_message(
+                "There are no classes or functions in this file!", ephemeral=True
+            )
+
+        shown = SymbolView.MAX_SYMBOLS
+        await interaction.response.send_message(
+            "Pick a symbol to jump to"
+            + (f" (showing the first {shown}, use Find for the rest)" if len(symbols) > shown else ""),
+            view=SymbolView(symbols, self.parent),
+            ephemeral=True,
+        )
+
     async def callback(self, interaction: disnake.MessageInteraction):
         await interaction.message.delete()
         clicked = self.values[0]
@@ -161,6 +193,39 @@ class OptionSelect(disnake.ui.Select):
             await self.find_option(interaction)
         elif clicked == "2":
             await self.goto_option(interaction)
+        elif clicked == "3":
+            await self.symbol_option(interaction)
+
+
+class SymbolSelect(disnake.ui.Select):
+    def __init__(self, symbols: list[Symbol], start: int, parent: EditView):
+        super().__init__(
+            placeholder=f"Symbols {start + 1}-{start + len(symbols)}",
+            options=[
+                disnake.SelectOption(
+                    value=str(symbol.line),
+                    label=symbol.name[:100],
+                    description=f"{symbol.kind}, line {symbol.line}",
+                )
+                for symbol in symbols
+            ],
+        )
+        self.parent = parent
+
+    async def callback(self, interaction: disnake.MessageInteraction):
+        await interaction.response.defer()
+        self.parent.page = self.parent.layout.page_of(int(self.values[0]) - 1)
+        await self.parent.refresh_message(self.parent.page)
+
+
+class SymbolView(disnake.ui.View):
+    MAX_SYMBOLS = 125  # 5 rows of 25 options
+
+    def __init__(self, symbols: list[Symbol], parent: EditView):
+        super().__init__()
+        symbols = symbols[: self.MAX_SYMBOLS]
+        for start in range(0, len(symbols), 25):
+            self.add_item(SymbolSelect(symbols[start: start + 25], start, parent))
 
 
 class OptionView(disnake.ui.View):
@@ -168,12 +233,11 @@ class OptionView(disnake.ui.View):
         self,
         ctx: commands.Context,
         file: File,
-        pages: list[str],
         bot_message: disnake.Message,
         parent: EditView,
     ):
         super().__init__()
-        self.add_item(OptionSelect(ctx, file, pages, bot_message, parent))
+        self.add_item(OptionSelect(ctx, file, bot_message, parent))
 
 
 class EditView(disnake.ui.View):
@@ -210,6 +274,8 @@ class EditView(disnake.ui.View):
         self.undo = self.file_view.file.undo
         self.redo = self.file_view.file.redo
         self.page = 0
+        self._layout = None
+        self._layout_key = None
         self.extension = None
         self.SUDO = self.ctx.me.guild_permissions.manage_messages
 
@@ -217,26 +283,43 @@ class EditView(disnake.ui.View):
         self.add_item(SaveButton(ctx, bot_message, file_, row=2))
 
     @property
-    def pages(self):
-        lines = add_lines(self.file.content)
-        return ["".join(lines[x: x + 50]) for x in range(0, len(lines), 50)]
+    def layout(self) -> PageIndex:
+        """The current content packed into pages, rebuilt only after an edit or rename."""
+        key = (self.file.content, self.file.filename, self.file.extension)
+        # compared by identity, so checking for an edit doesn't scan the content
+        if self._layout is None or any(a is not b for a, b in zip(key, self._layout_key)):
+            self._layout = PageIndex(
+                add_lines(self.file.content),
+                overhead=len(self.page_description("", 9999, 9999)) + len(self.file.filename) + 6,
+            )
+            self._layout_key = key
+        return self._layout
+
+    def page_description(self, code: str, page: int, pages: int) -> str:
+        return f"```{self.file.extension}\n{escape_codeblock(code)}\n```\nPage: {page + 1}/{pages}"
+
+    def render_page(self, page: int) -> str:
+        layout = self.layout
+        page = min(page, layout.page_count - 1)
+        return self.page_description("".join(layout.page(page)), page, layout.page_count)
 
     async def refresh_message(self, page):
-        n = "\n"
         embed = self.bot_message.embeds[0]
-        pages = [self.file.content.splitlines()[x: x + 50] for x in range(0, len(self.file.content.splitlines()), 50)]
-        embed.description = f"```{self.file.extension}\n{n.join(pages[page])}\n```\n{page + 1}/{len(pages)}"
+        embed.description = self.render_page(page)
         await self.bot_message.edit(embed=embed, view=self)
 
     async def edit(self, inter):
         await inter.response.defer()
 
+        self.page = min(self.page, self.layout.page_count - 1)
         await self.bot_message.edit(
-            embed=EmbedFactory.code_embed(
-                self.ctx,
-                "".join(add_lines(self.file_view.file.content)),
-                self.file.filename,
-            ),
+            embed=disnake.Embed(
+                title="Jarvide Text Editor",
+                description=f"**{self.file.filename}**\n{self.render_page(self.page)}",
+                timestamp=self.ctx.message.created_at,
+            )
+            .set_author(name=self.ctx.author.name, icon_url=self.ctx.author.display_avatar.url)
+            .set_footer(text="The official jarvide text editor and ide"),
         )
 
     @disnake.ui.button(label="Options", style=disnake.ButtonStyle.gray)
@@ -245,7 +328,7 @@ class EditView(disnake.ui.View):
     ):
         await interaction.response.send_message(
             "᲼",
-            view=OptionView(self.ctx, self.file, self.pages, self.bot_message, self),
+            view=OptionView(self.ctx, self.file, self.bot_message, self),
         )
 
     @disnake.ui.button(label="Replace", style=disnake.ButtonStyle.gray)
@@ -333,19 +416,52 @@ class EditView(disnake.ui.View):
         embed = EmbedFactory.ide_embed(self.ctx, description)
         await self.bot_message.edit(embed=embed)
 
+    @disnake.ui.button(label="Diff", style=disnake.ButtonStyle.grey, row=0)
+    async def diff_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        if self.file.saved_content is None:
+            return await interaction.response.send_message(
+                "This file hasn't been saved yet, so there is nothing to compare against!",
+                ephemeral=True,
+            )
+        if not self.file.changed():
+            return await interaction.response.send_message(
+                "You have made no changes since the last save!", ephemeral=True
+            )
+
+        await interaction.response.defer()
+        try:
+            diff = await diff_in_thread(
+                self.file.saved_content, self.file.content, "saved", "current"
+            )
+        except DiffTimeout as error:
+            return await interaction.channel.send(str(error), delete_after=15)
+
+        await LinePaginator(
+            interaction,
+            [f"\n{line}" for line in diff] or ["\n[No differences]"],
+            prefix="```diff",
+            suffix="```",
+            line_limit=30,
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name}'s diff for {self.file.filename}",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
+
     @disnake.ui.button(label="Prev", style=disnake.ButtonStyle.blurple, row=2)
     async def previous_button(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ):
         await interaction.response.defer()
-        if page_integrity(self.page, len(self.pages), "back"):
+        if page_integrity(self.page, self.layout.page_count, "back"):
             self.page -= 1
         else:
-            self.page = len(self.pages) - 1
+            self.page = self.layout.page_count - 1
         embed = (
             disnake.Embed(
-                description=f"```{self.file.extension}\n"
-                            f"{''.join(self.pages[self.page])}\n```\nPage: {self.page + 1}/{len(self.pages)}",
+                description=self.render_page(self.page),
                 timestamp=self.ctx.message.created_at,
             )
             .set_author(
@@ -361,14 +477,13 @@ class EditView(disnake.ui.View):
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ):
         await interaction.response.defer()
-        if page_integrity(self.page, len(self.pages), "next"):
+        if page_integrity(self.page, self.layout.page_count, "next"):
             self.page += 1
         else:
             self.page = 0
         embed = (
             disnake.Embed(
-                description=f"```{self.file.extension}\n{''.join(self.pages[self.page])}"
-                            f"\n```\nPage: {self.page + 1}/{len(self.pages)}",
+                description=self.render_page(self.page),
                 timestamp=self.ctx.message.created_at,
             )
             .set_author(
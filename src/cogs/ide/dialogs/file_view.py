@@ -1,15 +1,29 @@
+import datetime
 import disnake
-import aiohttp
 
 from src.utils import (
     File,
     ExitButton,
     SaveButton,
     add_lines,
+    escape_codeblock,
     EmbedFactory,
     LinePaginator,
+    PageIndex,
     TextPaginator,
     get_info,
+    ExecutionError,
+    execute,
+    check_response,
+    check_syntax,
+    benchmark,
+    format_benchmark,
+    profile,
+    format_profile,
+    list_revisions,
+    load_revision,
+    DiffTimeout,
+    diff_in_thread,
 )
 from .edit_view import EditView
 
@@ -44,13 +58,33 @@ class FileView(disnake.ui.View):
         self.add_item(ExitButton(ctx, bot_message, row=1))
         self.add_item(SaveButton(ctx, bot_message, file_, row=0))
 
+    async def preflight(self, interaction: disnake.MessageInteraction) -> bool:
+        if self.file.extension != "py":
+            return True
+
+        error = await check_syntax(self.file.content, self.file.filename)
+        if error is None:
+            return True
+
+        line = (error.text or "").rstrip("\n")
+        at = max((error.offset or 1) - 1, 0)
+        end = 0
+        if getattr(error, "end_lineno", None) == error.lineno:
+            end = error.end_offset or 0
+        underlined = self.bot.underline(line, at, max(end - 1 - at, 1))
+        await interaction.channel.send(
+            f"SyntaxError: {error.msg} (line {error.lineno})\n```py\n{escape_codeblock(underlined)}\n```",
+            delete_after=15,
+        )
+        return False
+
     @disnake.ui.button(label="Read", style=disnake.ButtonStyle.green)
     async def first_button(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ):
         await interaction.response.defer()
-        content = add_lines(self.file.content)
-        if len("".join(content)) < 2000:
+        content = add_lines(await self.file.load())
+        if PageIndex(content, overhead=len(f"```{self.file.extension}\n```")).page_count == 1:
             embed = EmbedFactory.ide_embed(
                 self.ctx, "".join(content), format_=self.file.extension
             )
@@ -61,7 +95,7 @@ class FileView(disnake.ui.View):
             content,
             prefix=f"```{self.file.extension}",
             suffix="```",
-            line_limit=30,
+            line_limit=None,
             timeout=None,  # type: ignore
             embed_author_kwargs={
                 "name": f"{self.ctx.author.name}'s automated paginator for {self.file.filename}",
@@ -73,58 +107,192 @@ class FileView(disnake.ui.View):
     async def second_button(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ):
-        content = self.file.content
-        name = self.extension
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url="https://emkc.org/api/v1/piston/execute",
-                json={"language": name, "source": content},
-            ) as data:
-
-                json = await data.json()
-                if "message" in json and "runtime is unknown" in json["message"]:
-                    await interaction.response.defer()
-                    return await interaction.channel.send(
-                        "This file has an invalid file extension and therefore I do not know what language to run it in! Try renaming your file",
-                        delete_after=15,
-                    )
-
-                if "output" not in json:
-                    await interaction.response.defer()
-                    return await interaction.channel.send(
-                        "Something went wrong! Maybe the file is too long!",
-                        delete_after=15,
-                    )
-                output = json["output"].strip("\n").strip()
-                if not output:
-                    output = "[No output]"
-
-            await interaction.response.defer()
-            await TextPaginator(
-                interaction,
-                f"```yaml\n{output}```",
-                embed_author_kwargs={
-                    "name": f"{self.ctx.author.name} evaluator for {self.file.filename}",
-                    "icon_url": self.ctx.author.avatar.url,
-                },
-            ).start()
+        await interaction.response.defer()
+        await self.file.load()
+        if not await self.preflight(interaction):
+            return
+        try:
+            json = await execute(self.file.extension, self.file.content)
+            check_response(json)
+        except ExecutionError as e:
+            return await interaction.channel.send(str(e), delete_after=15)
+
+        output = json["output"].strip("\n").strip()
+        if not output:
+            output = "[No output]"
+        if json.get("cached"):
+            output += "\n[compile cache hit]"
+
+        await TextPaginator(
+            interaction,
+            output,
+            prefix="```yaml",
+            suffix="```",
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name} evaluator for {self.file.filename}",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
+
+    @disnake.ui.button(label="Benchmark", style=disnake.ButtonStyle.blurple, row=2)
+    async def benchmark_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        await interaction.response.defer()
+        if self.file.extension != "py":
+            return await interaction.channel.send(
+                "Only python files can be benchmarked!", delete_after=15
+            )
+        await self.file.load()
+        if not await self.preflight(interaction):
+            return
+        try:
+            result = await benchmark(self.file.content, filename=self.file.filename)
+        except ExecutionError as e:
+            return await interaction.channel.send(str(e), delete_after=15)
+
+        await TextPaginator(
+            interaction,
+            format_benchmark(self.file.filename, result),
+            prefix="```yaml",
+            suffix="```",
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name} benchmark for {self.file.filename}",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
+
+    @disnake.ui.button(label="Profile", style=disnake.ButtonStyle.blurple, row=2)
+    async def profile_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        await interaction.response.defer()
+        if self.file.extension != "py":
+            return await interaction.channel.send(
+                "Only python files can be profiled!", delete_after=15
+            )
+        await self.file.load()
+        if not await self.preflight(interaction):
+            return
+        try:
+            result = await profile(self.file.content, filename=self.file.filename)
+        except ExecutionError as e:
+            return await interaction.channel.send(str(e), delete_after=15)
+
+        await LinePaginator(
+            interaction,
+            format_profile(result),
+            prefix="```yaml",
+            suffix="```",
+            line_limit=20,
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name} profiler for {self.file.filename}",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
+
+    @disnake.ui.button(label="History", style=disnake.ButtonStyle.blurple, row=2)
+    async def history_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        if self.file.file_id is None:
+            return await interaction.response.send_message(
+                "This file has no history yet! Save it first.", ephemeral=True
+            )
+        revisions = await list_revisions(self.bot.engine, self.file.file_id)
+        if not revisions:
+            return await interaction.response.send_message(
+                "This file has no history yet! Save a change first.", ephemeral=True
+            )
+
+        await interaction.response.send_message(
+            "Type `diff <a> <b>` to compare two revisions, `restore <n>` to open one, or `quit`",
+            ephemeral=True,
+        )
+        await LinePaginator(
+            interaction,
+            [
+                f"\n#{revision['number']:<4} {datetime.datetime.fromtimestamp(revision['create_epoch']):%Y-%m-%d %H:%M}"
+                f"  {revision['size']:>9,} bytes  {revision['kind']}"
+                for revision in revisions
+            ],
+            prefix="```yaml",
+            suffix="```",
+            line_limit=20,
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name}'s history for {self.file.filename}",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
+
+        message = await self.bot.wait_for(
+            "message",
+            check=lambda m: self.ctx.author == m.author
+            and m.channel == self.ctx.channel,
+        )
+        # a message with only an attachment has no words at all
+        command, *numbers = message.content.lower().split() or [""]
+        if command == "quit":
+            return
+        if not all(number.isdigit() for number in numbers) or (command, len(numbers)) not in (
+            ("diff", 2),
+            ("restore", 1),
+        ):
+            return await interaction.channel.send(
+                "That is not a valid history command!", delete_after=15
+            )
+
+        contents = [
+            await load_revision(self.bot.engine, self.file.file_id, int(number))
+            for number in numbers
+        ]
+        if None in contents:
+            return await interaction.channel.send(
+                "That revision doesn't exist!", delete_after=15
+            )
+
+        if command == "restore":
+            self.file.undo.append(await self.file.load())
+            self.file.content = contents[0]
+            return await self.bot_message.edit(
+                embed=EmbedFactory.ide_embed(
+                    self.ctx,
+                    f"Restored revision #{numbers[0]}, press Save to keep it\n{await get_info(self.file)}",
+                )
+            )
+
+        try:
+            diff = await diff_in_thread(
+                contents[0], contents[1], f"#{numbers[0]}", f"#{numbers[1]}"
+            )
+        except DiffTimeout as error:
+            return await interaction.channel.send(str(error), delete_after=15)
+        await LinePaginator(
+            interaction,
+            [f"\n{line}" for line in diff] or ["\n[No differences]"],
+            prefix="```diff",
+            suffix="```",
+            line_limit=30,
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name}'s diff for {self.file.filename}",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
 
     @disnake.ui.button(label="Edit", style=disnake.ButtonStyle.green)
     async def third_button(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ):
-        import math
         await interaction.response.defer()
-        content: list[str] = add_lines(self.file.content)
+        await self.file.load()
         view = EditView(self.ctx, self.file, self.bot_message, self)
         await self.bot_message.edit(
             embed=EmbedFactory.code_embed(
                 self.ctx,
-                "".join(content[:50]),
+                "".join(view.layout.page(0)),
                 self.file.filename,
                 self.file.extension,
-                f"\n1/{math.ceil(len(content)/50)}"
+                f"\nPage: 1/{view.layout.page_count}"
             ),
             view=view,
         )
@@ -148,7 +316,7 @@ class FileView(disnake.ui.View):
                 "That filename is too long! The maximum limit is 12 character"
             )
 
-        file_ = File(filename=filename, content=self.file.content, bot=self.bot)
+        file_ = File(filename=filename, content=await self.file.load(), bot=self.bot)
         description = await get_info(file_)
 
         self.file = file_
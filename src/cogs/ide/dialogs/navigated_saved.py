@@ -1,20 +1,36 @@
+import asyncio
 import disnake
 import time
 
 from disnake.ext import commands
 from typing import Optional
-from odmantic import Model
 
-from src.utils import ExitButton, EmbedFactory, File, get_info
-
-
-class FileModel(Model):  # noqa
-    user_id: int
-    name: str
-    file_url: Optional[str] = None
-    folder: Optional[str] = None
-    create_epoch: float
-    last_edit_epoch: Optional[float] = None
+from src.utils import (
+    ExitButton,
+    EmbedFactory,
+    File,
+    FileModel,
+    CursorPaginator,
+    get_info,
+    escape_codeblock,
+    load_blob,
+    save_file,
+    count_paths,
+    list_paths,
+    delete_path,
+    touch_file,
+    record_revision,
+    release_blob,
+    delete_folder,
+    move_file,
+    move_folder,
+    ancestors_of,
+    folder_path,
+    ArchiveError,
+    export_archive,
+    index_file,
+    search,
+)
 
 
 class DefaultButtons(disnake.ui.View):
@@ -55,11 +71,8 @@ class DefaultButtons(disnake.ui.View):
             check=lambda m: self.ctx.author == m.author
             and m.channel == self.ctx.channel,
         )
-        path = await self.bot.engine.find_one(
-            FileModel,
-            FileModel.user_id == self.ctx.author.id,
-            FileModel.folder == self.path,
-            FileModel.name == "folder: " + directory.content,
+        path = await self.bot.file_trees.find(
+            self.ctx.author.id, self.path, "folder: " + directory.content
         )
 
         if not path:
@@ -68,7 +81,7 @@ class DefaultButtons(disnake.ui.View):
             return await interaction.channel.send(
                 f"{directory.content} doesn't exist!", delete_after=15
             )
-        self.path = f"{self.path}{path.name[8:]}/"
+        self.path = folder_path(self.path, path["name"][8:])
         embed = EmbedFactory.ide_embed(
             self.ctx,
             f"Moved into dir: {self.path}\n"
@@ -77,31 +90,52 @@ class DefaultButtons(disnake.ui.View):
 
         await self.bot_message.edit(embed=embed)
 
-    @disnake.ui.button(label="View folder", style=disnake.ButtonStyle.green)
-    async def view_folder(
-        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    async def send_listing(
+        self, interaction: disnake.MessageInteraction, folder: Optional[str]
     ):
-        files = "\n    - ".join(
-            [
-                f"{k.name}"
-                for k in await self.bot.engine.find(
-                    FileModel,
-                    FileModel.user_id == self.ctx.author.id,
-                    FileModel.folder == self.path,
+        # A tree already in memory is listed from there. Otherwise every page is its
+        # own covered query, so a cold listing never loads the whole account.
+        if self.bot.file_trees.loaded(self.ctx.author.id):
+            listing = await self.bot.file_trees.listing(self.ctx.author.id, folder)
+            total = len(listing)
+
+            async def page(skip: int, limit: int) -> list[tuple[str, str]]:
+                return listing[skip: skip + limit]
+        else:
+            total = await count_paths(self.bot.engine, self.ctx.author.id, folder)
+
+            async def page(skip: int, limit: int) -> list[tuple[str, str]]:
+                return await list_paths(
+                    self.bot.engine, self.ctx.author.id, folder, skip=skip, limit=limit
                 )
-            ]
-        )
 
-        embed = EmbedFactory.ide_embed(
-            self.ctx,
-            f"""{self.path}:
-    - {files}""",
-        )
+        async def fetch(skip: int, limit: int) -> list[str]:
+            paths = await page(skip, limit)
+            if not paths:
+                return ["\n    [empty]"]
+            if folder is None:
+                return [f"\n    - {parent}{name}" for parent, name in paths]
+            return [f"\n    - {name}" for _, name in paths]
 
         await interaction.response.defer()
-        await self.bot_message.edit(
-            embed=embed,
-        )
+        await CursorPaginator(
+            interaction,
+            fetch,
+            total,
+            line_limit=25,
+            prefix=f"```yaml\n{folder or '/'}:",
+            suffix="```",
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name}'s saved files",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
+
+    @disnake.ui.button(label="View folder", style=disnake.ButtonStyle.green)
+    async def view_folder(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        await self.send_listing(interaction, self.path)
 
     @disnake.ui.button(label="New folder", style=disnake.ButtonStyle.green)
     async def create_folder(
@@ -123,18 +157,11 @@ class DefaultButtons(disnake.ui.View):
                 delete_after=15,
             )
 
-        dir_files = [
-            k.name
-            for k in await self.bot.engine.find(
-                FileModel,
-                FileModel.user_id == self.ctx.author.id,
-                FileModel.folder == self.path,
-                FileModel.name == folder.content,
-            )
-        ]
-        if folder.content in dir_files:
-            return await interaction.response.send_message(
-                "You can't have a folder in with the same name!"
+        if await self.bot.file_trees.find(
+            self.ctx.author.id, self.path, "folder: " + folder.content
+        ):
+            return await interaction.channel.send(
+                "You can't have a folder in with the same name!", delete_after=15
             )
 
         folder_ = FileModel(
@@ -142,6 +169,7 @@ class DefaultButtons(disnake.ui.View):
             user_id=self.ctx.author.id,
             create_epoch=int(time.time()),
             folder=self.path,
+            ancestors=ancestors_of(self.path),
         )
 
         embed = EmbedFactory.ide_embed(
@@ -150,31 +178,17 @@ class DefaultButtons(disnake.ui.View):
         )
 
         await self.bot.engine.save(folder_)
+        self.bot.file_trees.put(
+            self.ctx.author.id,
+            {"folder": folder_.folder, "name": folder_.name, "file_url": None},
+        )
         await self.bot_message.edit(embed=embed)
 
     @disnake.ui.button(label="All files", style=disnake.ButtonStyle.green)
     async def view_files(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ):
-        files = "\n    - ".join(
-            [
-                f"{k.name}"
-                for k in await self.bot.engine.find(
-                    FileModel, FileModel.user_id == self.ctx.author.id
-                )
-            ]
-        )
-
-        embed = EmbedFactory.ide_embed(
-            self.ctx,
-            f"""/:
-    - {files}""",
-        )
-
-        await interaction.response.defer()
-        await self.bot_message.edit(
-            embed=embed,
-        )
+        await self.send_listing(interaction, None)
 
     @disnake.ui.button(label="Delete", style=disnake.ButtonStyle.danger, row=2)
     async def delete_button(
@@ -191,38 +205,191 @@ class DefaultButtons(disnake.ui.View):
         )
 
         filename = directory.content.split("/")[-1]
-        file_ = await self.bot.engine.find_one(
-            FileModel,
-            FileModel.user_id == self.ctx.author.id,
-            FileModel.name == filename,
-            FileModel.folder == self.path,
+        if await self.bot.file_trees.find(self.ctx.author.id, self.path, filename):
+            await delete_path(self.bot.engine, self.ctx.author.id, self.path, filename)
+            self.bot.file_trees.remove(self.ctx.author.id, self.path, filename)
+            return await interaction.channel.send(f"Successfully deleted {filename}")
+
+        folder = directory.content.strip("/").split("/")[-1]
+        if await self.bot.file_trees.find(
+            self.ctx.author.id, self.path, "folder: " + folder
+        ):
+            deleted = await delete_folder(
+                self.bot.engine, self.ctx.author.id, self.path, folder
+            )
+            self.bot.file_trees.invalidate(self.ctx.author.id)
+            return await interaction.channel.send(
+                f"Successfully deleted {folder} ({deleted} items)"
+            )
+
+        await interaction.channel.send(
+            f"I could not find a folder or file called {directory.content} in {self.path}"
         )
 
-        if file_:
-            await self.bot.engine.delete(file_)
-            return await interaction.channel.send(f"Successfully deleted {file_.name}")
+    async def move(
+        self,
+        interaction: disnake.MessageInteraction,
+        source: str,
+        new_parent: str,
+        new_name: Optional[str] = None,
+    ):
+        user_id = self.ctx.author.id
+        is_folder = source.endswith("/")
+        name = source.strip("/")
+        if not await self.bot.file_trees.find(
+            user_id, self.path, ("folder: " if is_folder else "") + name
+        ):
+            return await interaction.channel.send(
+                f"I could not find a folder or file called {source} in {self.path}",
+                delete_after=15,
+            )
+
+        if new_parent != "/":
+            grandparent, _, folder = new_parent[:-1].rpartition("/")
+            if not await self.bot.file_trees.find(
+                user_id, grandparent + "/", "folder: " + folder
+            ):
+                return await interaction.channel.send(
+                    f"{new_parent} doesn't exist!", delete_after=15
+                )
+
+        new_name = new_name or name
+        if len(new_name) > 12:
+            return await interaction.channel.send(
+                "That name is too long! The maximum limit is 12 character",
+                delete_after=15,
+            )
+        if await self.bot.file_trees.find(
+            user_id, new_parent, ("folder: " if is_folder else "") + new_name
+        ):
+            return await interaction.channel.send(
+                f"{new_parent}{new_name} already exists!", delete_after=15
+            )
 
-        folder = directory.content
-        if directory.content.endswith("/"):
-            folder = directory.content.split("/")[-2]
+        try:
+            if is_folder:
+                moved = await move_folder(
+                    self.bot.engine, user_id, self.path, name, new_parent, new_name
+                )
+            else:
+                moved = await move_file(
+                    self.bot.engine, user_id, self.path, name, new_parent, new_name
+                )
+        except ValueError as e:
+            return await interaction.channel.send(str(e), delete_after=15)
 
-        folder_ = await self.bot.engine.find_one(
-            FileModel,
-            FileModel.user_id == self.ctx.author.id,
-            FileModel.name == "folder: " + folder,
-            FileModel.folder == self.path,
+        self.bot.file_trees.invalidate(user_id)
+        await interaction.channel.send(
+            f"Moved {self.path}{source} to {new_parent}{new_name}{'/' if is_folder else ''} ({moved} items)"
         )
 
-        if folder_:
-            await self.bot.engine.delete(folder_)
-            await interaction.channel.send(f"Successfully deleted {file_.name}")
+    @disnake.ui.button(label="Rename", style=disnake.ButtonStyle.green, row=1)
+    async def rename_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        await interaction.response.send_message(
+            "What file/folder do you want to rename? End folders with a /, like `src/`",
+            ephemeral=True,
+        )
+        source = await self.bot.wait_for(
+            "message",
+            check=lambda m: self.ctx.author == m.author
+            and m.channel == self.ctx.channel,
+        )
+        await interaction.channel.send("What would you like the new name to be?")
+        name = await self.bot.wait_for(
+            "message",
+            check=lambda m: self.ctx.author == m.author
+            and m.channel == self.ctx.channel,
+        )
+        await self.move(interaction, source.content, self.path, name.content.strip("/"))
 
+    @disnake.ui.button(label="Move", style=disnake.ButtonStyle.green, row=1)
+    async def move_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        await interaction.response.send_message(
+            "What file/folder do you want to move? End folders with a /, like `src/`",
+            ephemeral=True,
+        )
+        source = await self.bot.wait_for(
+            "message",
+            check=lambda m: self.ctx.author == m.author
+            and m.channel == self.ctx.channel,
+        )
         await interaction.channel.send(
-            f"I could not find a folder or file called {directory.content} in {self.path}"
+            "Which folder should it move to? Use an absolute path like `/src/`"
+        )
+        destination = await self.bot.wait_for(
+            "message",
+            check=lambda m: self.ctx.author == m.author
+            and m.channel == self.ctx.channel,
         )
+        new_parent = destination.content.strip()
+        if not new_parent.startswith("/"):
+            new_parent = self.path + new_parent
+        await self.move(interaction, source.content, new_parent.rstrip("/") + "/")
+
+    @disnake.ui.button(label="Export", style=disnake.ButtonStyle.green, row=1)
+    async def export_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        await interaction.response.defer()
+        try:
+            fp = await export_archive(self.bot.engine, self.ctx.author.id, self.path)
+        except ArchiveError as e:
+            return await interaction.channel.send(str(e), delete_after=15)
+
+        name = self.path.strip("/").split("/")[-1] or f"{self.ctx.author.name}'s files"
+        with fp:
+            await interaction.channel.send(
+                f"Exported {self.path}",
+                file=disnake.File(fp=fp, filename=f"{name}.zip"),
+            )
+
+    @disnake.ui.button(label="Search all", style=disnake.ButtonStyle.green, row=1)
+    async def search_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        await interaction.response.send_message(
+            "What do you want to search for? (Whole words, case-insensitive)",
+            ephemeral=True,
+        )
+        query = await self.bot.wait_for(
+            "message",
+            check=lambda m: self.ctx.author == m.author
+            and m.channel == self.ctx.channel,
+        )
+        results = await search(self.bot.engine, self.ctx.author.id, query.content)
+        paths = await self.bot.file_trees.paths(self.ctx.author.id)
+        hits = [
+            f"\n{paths[result['file_id']]}:{line}"
+            for result in results
+            if result["file_id"] in paths
+            for line in result["lines"]
+        ]
+
+        async def fetch(skip: int, limit: int) -> list[str]:
+            return hits[skip: skip + limit] or ["\n[No results]"]
+
+        await CursorPaginator(
+            interaction,
+            fetch,
+            len(hits),
+            line_limit=25,
+            prefix=f"```yaml\nResults for {escape_codeblock(query.content)}:",
+            suffix="```",
+            embed_author_kwargs={
+                "name": f"{self.ctx.author.name}'s search results",
+                "icon_url": self.ctx.author.avatar.url,
+            },
+        ).start()
 
 
 class OpenFromSaved(DefaultButtons):
+    PREFETCH_FILES = 5
+    PREFETCH_CONCURRENCY = 2
+
     def __init__(self, ctx, bot_message):
         super().__init__(ctx, bot_message)
 
@@ -231,6 +398,32 @@ class OpenFromSaved(DefaultButtons):
         self.bot_message = bot_message
         self.add_item(ExitButton(self.ctx, self.bot_message, row=2))
 
+        self.prefetching: list[asyncio.Task] = []
+        self.prefetching.append(asyncio.create_task(self.prefetch()))
+
+    async def prefetch(self):
+        semaphore = asyncio.Semaphore(self.PREFETCH_CONCURRENCY)
+
+        async def limited(document: dict) -> bytes:
+            async with semaphore:
+                return await load_blob(
+                    document["file_url"], document.get("chunks"), document.get("codec")
+                )
+
+        for document in await self.bot.file_trees.recent(
+            self.ctx.author.id, self.PREFETCH_FILES
+        ):
+            task = self.bot.file_contents.prefetch(
+                document["file_url"], lambda document=document: limited(document)
+            )
+            if task is not None:
+                self.prefetching.append(task)
+
+    async def on_timeout(self) -> None:
+        for task in self.prefetching:
+            task.cancel()
+        await super().on_timeout()
+
     @disnake.ui.button(label="Select file", style=disnake.ButtonStyle.danger, row=2)
     async def select_button(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
@@ -246,11 +439,8 @@ class OpenFromSaved(DefaultButtons):
             and m.channel == self.ctx.channel,
         )
 
-        file_model = await self.bot.engine.find_one(
-            FileModel,
-            FileModel.user_id == self.ctx.author.id,
-            FileModel.name == filename.content,
-            FileModel.folder == self.path,
+        file_model = await self.bot.file_trees.find(
+            self.ctx.author.id, self.path, filename.content
         )
 
         if not file_model:
@@ -260,7 +450,14 @@ class OpenFromSaved(DefaultButtons):
                 f"{filename.content} doesnt exist!", delete_after=15
             )
 
-        file_ = await File.from_url(bot=self.bot, url=file_model.file_url)
+        last_opened_epoch = await touch_file(
+            self.bot.engine, self.ctx.author.id, self.path, filename.content
+        )
+        self.bot.file_trees.put(
+            self.ctx.author.id,
+            {**file_model, "last_opened_epoch": last_opened_epoch},
+        )
+        file_ = File.from_document(bot=self.bot, document=file_model)
         embed = EmbedFactory.ide_embed(
             self.ctx,
             f"Opened {filename.content}\n{''.join(['-' for _ in range(len(filename.content)+len('Opened '))])}\n{await get_info(file_)}",
@@ -289,23 +486,64 @@ class SaveFile(DefaultButtons):
     ):
         from . import FileView
 
-        attachment = await self.file.to_real()
+        # uploading, saving and indexing can take longer than discord waits for a reply
+        await interaction.response.defer()
+        stored = None
+        previous_id, previous_chunks = self.file.file_id, self.file.chunks
+        parent_content, parent_hash = self.file.saved_content, self.file.saved_hash
+        if self.file.changed():
+            stored = await self.file.store()
+            info = await get_info(self.file)
+            if stored["codec"]:
+                info += (
+                    f"\nStored: {stored['stored_size'] // 1000} KB compressed with {stored['codec']}"
+                    f" ({1 - stored['stored_size'] / self.file.size:.0%} saved)"
+                )
+        else:
+            info = f"Nothing changed since the last save, so nothing was uploaded\n{await get_info(self.file)}"
+        metadata = {**self.file.describe(), **self.file.storage_info()}
 
-        dir_files = [
-            k.name
-            for k in await self.bot.engine.find(
-                FileModel,
-                FileModel.user_id == self.ctx.author.id,
-                FileModel.folder == self.path,
-            )
-        ]
-        file_ = FileModel(
-            file_url=attachment.url,
-            name=self.file.filename,
+        overwrote_file, self.file.file_id = await save_file(
+            self.bot.engine,
             user_id=self.ctx.author.id,
-            create_epoch=int(time.time()),
             folder=self.path,
+            name=self.file.filename,
+            file_url=self.file.url,
+            **metadata,
         )
+        self.bot.file_trees.put(
+            self.ctx.author.id,
+            {
+                "folder": self.path,
+                "name": self.file.filename,
+                "file_url": self.file.url,
+                **metadata,
+                "_id": self.file.file_id,
+            },
+        )
+        # a new document, or one that replaced the file this was opened from, has
+        # no tokens of its own yet even if the content is unchanged, and an unchanged
+        # file opened from the saved files may not have been downloaded yet
+        if stored is not None or not overwrote_file or self.file.file_id != previous_id:
+            await index_file(
+                self.bot.engine,
+                file_id=self.file.file_id,
+                user_id=self.ctx.author.id,
+                content=await self.file.load(),
+            )
+        if stored is not None:
+            await record_revision(
+                self.bot.engine,
+                file_id=self.file.file_id,
+                user_id=self.ctx.author.id,
+                content=self.file.content,
+                content_hash=metadata["content_hash"],
+                stored=stored,
+                parent_content=parent_content,
+                parent_hash=parent_hash,
+            )
+            await release_blob(self.bot, self.bot.engine, previous_chunks)
+
         overwrote = (
             f"Overwrote file {self.file.filename}"
             + "".join(["-" for _ in range(len(self.file.filename) + len("Saved "))])
@@ -314,11 +552,9 @@ class SaveFile(DefaultButtons):
         n = "\n"
         embed = EmbedFactory.ide_embed(
             self.ctx,
-            f"Saved {self.file.filename}\n{''.join(['-' for _ in range(len(self.file.filename)+len('Saved '))])}{overwrote if self.file.filename in dir_files else n}{await get_info(attachment)}",
+            f"Saved {self.file.filename}\n{''.join(['-' for _ in range(len(self.file.filename)+len('Saved '))])}{overwrote if overwrote_file else n}{info}",
         )
 
-        await interaction.response.defer()
-        await self.bot.engine.save(file_)
         await self.bot_message.edit(
             embed=embed, view=FileView(self.ctx, self.file, self.bot_message)
         )
@@ -1,9 +1,20 @@
-import aiohttp
-import base64
 import disnake
 import re
 
-from src.utils import EmbedFactory, File, get_info
+from src.utils import (
+    EmbedFactory,
+    File,
+    get_info,
+    ArchiveError,
+    ARCHIVE_SUFFIXES,
+    ARCHIVE_MAX_UPLOAD,
+    archive_stem,
+    spool,
+    import_archive,
+    FetchError,
+    fetch_text,
+    read_attachment,
+)
 from .file_view import FileView
 
 THUMBS_UP = "👍"
@@ -68,12 +79,12 @@ class OpenView(disnake.ui.View):
         real_file = message.attachments[0]
         try:
             file_ = File(
-                content=await real_file.read(),
+                content=await read_attachment(real_file),
                 filename=real_file.filename,
                 bot=self.bot,
             )
-        except UnicodeDecodeError:
-            return await interaction.channel.send("Upload a valid text file!")
+        except FetchError as e:
+            return await interaction.channel.send(str(e))
         await message.add_reaction(THUMBS_UP)
 
         description = (
@@ -129,29 +140,18 @@ class OpenView(disnake.ui.View):
                 if self.SUDO:
                     await url.delete()
 
-        async with aiohttp.ClientSession() as session:
-            a = await session.get(
-                f"https://api.github.com/repos/{repo}/contents/{path}",
-                headers={"Accept": "application/vnd.github.v3+json"},
+        # the raw file streams, unlike the api's base64 json that has to be decoded whole
+        try:
+            content = await fetch_text(
+                f"https://raw.githubusercontent.com/{repo}/{branch}/{path}"
             )
-            json = await a.json()
-            if "content" not in json:
-                b = await session.get(
-                    f"https://raw.githubusercontent.com/{repo}/{branch}/{path}",
-                    headers={"Accept": "application/vnd.github.v3+json"},
-                )
-                content = (await b.text()).replace("`", "`​")
-                if content == "404: Not Found":
-                    await interaction.channel.send(
-                        "Invalid github link, please exit the IDE and try again.", delete_after=5
-                    )
-                    if self.SUDO:
-                        await url.delete()
-                    return
-            else:
-                content = json["content"]
-
-                content = base64.b64decode(content).decode("utf-8")
+        except FetchError as e:
+            await interaction.channel.send(
+                f"{e} Please exit the IDE and try again.", delete_after=5
+            )
+            if self.SUDO:
+                await url.delete()
+            return
 
         await url.add_reaction(THUMBS_UP)
         file_ = File(content=content, filename=url.content.split("/")[-1], bot=self.bot)
@@ -219,9 +219,10 @@ class OpenView(disnake.ui.View):
         await filename.add_reaction(THUMBS_UP)
         url = message.content.replace("/hastebin/", "/hastebin/raw/")
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                text = await response.read()
+        try:
+            text = await fetch_text(url)
+        except FetchError as e:
+            return await interaction.channel.send(str(e), delete_after=15)
 
         file_ = File(filename=filename.content, content=text, bot=self.bot)
         description = await get_info(file_)
@@ -297,6 +298,80 @@ class OpenView(disnake.ui.View):
             embed=embed, view=OpenFromSaved(self.ctx, self.bot_message)
         )
 
+    @disnake.ui.button(label="Import", style=disnake.ButtonStyle.green)
+    async def import_button(
+        self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
+    ):
+        from . import OpenFromSaved
+
+        await interaction.response.send_message(
+            f"Upload a zip or tar archive! ({', '.join(ARCHIVE_SUFFIXES)})", ephemeral=True
+        )
+        for child in self.children:
+            if isinstance(child, disnake.ui.Button):
+                if child.label != "Exit":
+                    child.disabled = True
+        await self.bot_message.edit(view=self)
+
+        message = await self.bot.wait_for(
+            "message",
+            check=lambda m: self.ctx.author == m.author
+            and m.channel == self.ctx.channel,
+        )
+        if self.is_exited:
+            return
+        if not message.attachments or not message.attachments[0].filename.lower().endswith(
+            ARCHIVE_SUFFIXES
+        ):
+            return await interaction.channel.send(
+                "That is not a zip or tar archive!", delete_after=15
+            )
+
+        attachment = message.attachments[0]
+        if attachment.size > ARCHIVE_MAX_UPLOAD:
+            return await interaction.channel.send(
+                f"That archive is over {ARCHIVE_MAX_UPLOAD // 1024 // 1024} MB!",
+                delete_after=15,
+            )
+        root = archive_stem(attachment.filename)
+        if len(root) > 12:
+            return await interaction.channel.send(
+                "That archive's name is too long for a folder! The maximum limit is 12 characters",
+                delete_after=15,
+            )
+        if await self.bot.file_trees.find(self.ctx.author.id, "/", "folder: " + root):
+            return await interaction.channel.send(
+                f"You already have a folder called {root}!", delete_after=15
+            )
+
+        await message.add_reaction("⏳")
+        try:
+            fp = await spool(attachment.url)
+            with fp:
+                result = await import_archive(
+                    self.bot,
+                    self.bot.engine,
+                    self.ctx.author.id,
+                    fp,
+                    attachment.filename,
+                    f"/{root}/",
+                )
+        except ArchiveError as e:
+            return await interaction.channel.send(str(e), delete_after=15)
+        finally:
+            self.bot.file_trees.invalidate(self.ctx.author.id)
+        await message.add_reaction(THUMBS_UP)
+
+        embed = EmbedFactory.ide_embed(
+            self.ctx,
+            f"Imported {result['imported']} files into /{root}/"
+            f"\nSize: {result['size'] // 1000} KB ({result['size']:,} bytes)"
+            + (f"\nSkipped {result['skipped']} binary files" if result["skipped"] else ""),
+        )
+        await self.bot_message.edit(
+            embed=embed, view=OpenFromSaved(self.ctx, self.bot_message)
+        )
+
     @disnake.ui.button(label="Exit", style=disnake.ButtonStyle.danger)
     async def exit_button(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
@@ -3,7 +3,13 @@ import copy
 import disnake
 
 from .dialogs import OpenView
-from src.utils import EmbedFactory
+from src.utils import (
+    EmbedFactory,
+    ensure_indexes,
+    ensure_history_indexes,
+    ensure_search_indexes,
+    backfill_search,
+)
 from disnake.ext import commands, tasks
 
 
@@ -15,7 +21,23 @@ class Ide(commands.Cog):
         self.emoji = "📂"
         self.short_help_doc = "IDE commands , to view and edit your code"
         self.active_commands = {}
+        self.prepared_storage = False  # on_ready fires again on every reconnect
         self.check_activity.start()
+        self.evict_file_trees.start()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self.prepared_storage:
+            return
+        self.prepared_storage = True
+        await ensure_indexes(self.bot.engine)
+        await ensure_history_indexes(self.bot.engine)
+        await ensure_search_indexes(self.bot.engine)
+        await backfill_search(self.bot.engine)
+
+    @tasks.loop(minutes=1)
+    async def evict_file_trees(self):
+        self.bot.file_trees.evict_idle()
 
     @tasks.loop(seconds=1)
     async def check_activity(self):
@@ -2,6 +2,8 @@ import disnake
 
 from disnake.ext.commands import Cog, Context, Bot, command
 
+from src.utils import ensure_indexes, index_usage, explain_lookups
+
 
 class Staff(Cog, command_attrs={"hidden": True}):
     """Staff cog for only staff members to use."""
@@ -52,6 +54,48 @@ class Staff(Cog, command_attrs={"hidden": True}):
         )
         await ctx.send(embed=embed)
 
+    @command()
+    async def indexes(self, ctx: Context):
+        """Ensure the saved-files indexes and check that lookups use them."""
+        created = await ensure_indexes(self.bot.engine)
+        usage = await index_usage(self.bot.engine)
+        checks = await explain_lookups(self.bot.engine, ctx.author.id)
+
+        embed = disnake.Embed(color=disnake.Color.dark_gold())
+        embed.add_field(
+            name="Indexes",
+            value="\n".join(
+                f"`{name}`: {ops:,} ops{' (ensured)' if name in created else ''}"
+                for name, ops in usage.items()
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="Explain",
+            value="\n".join(
+                f"{'✅' if check['indexed'] else '❌'} {check['query']}: "
+                f"{' > '.join(check['stages'])} in {check['ms']:.1f} ms"
+                for check in checks
+            ),
+            inline=False,
+        )
+        await ctx.send(embed=embed)
+
+    @command()
+    async def treecache(self, ctx: Context):
+        """Show the saved-files tree cache metrics."""
+        stats = self.bot.file_trees.stats()
+        embed = disnake.Embed(color=disnake.Color.dark_gold())
+        embed.add_field(
+            name="File tree cache",
+            value=f"Users cached: {stats['users']}\n"
+            f"Hits: {stats['hits']:,}\n"
+            f"Misses: {stats['misses']:,}\n"
+            f"Evictions: {stats['evictions']:,}\n"
+            f"Hit rate: {stats['hit_rate']:.1%}",
+        )
+        await ctx.send(embed=embed)
+
 
 def setup(bot: Bot) -> None:
     bot.add_cog(Staff(bot))
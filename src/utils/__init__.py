@@ -1,3 +1,91 @@
-from .paginator import TextPaginator, LinePaginator
+from .paginator import (
+    EMBED_LIMIT,
+    PageIndex,
+    TextPaginator,
+    LinePaginator,
+    CursorPaginator,
+)
 from .confirmation import prompt
+from .executor import (
+    ExecutionError,
+    execute,
+    check_response,
+    check_syntax,
+    benchmark,
+    format_benchmark,
+    profile,
+    format_profile,
+)
+from .storage import (
+    FileModel,
+    FileTreeCache,
+    ContentCache,
+    ancestors_of,
+    folder_path,
+    subtree_query,
+    list_subtree,
+    ensure_indexes,
+    migrate_paths,
+    compact_duplicates,
+    save_file,
+    count_paths,
+    list_paths,
+    delete_path,
+    touch_file,
+    delete_folder,
+    release_blob,
+    move_file,
+    move_folder,
+    index_usage,
+    explain_lookups,
+)
+from .blobs import (
+    IntegrityError,
+    download,
+    upload_blob,
+    download_blob,
+    store_blob,
+    load_blob,
+    delete_blob,
+)
+from .fetch import (
+    FetchError,
+    MAX_TEXT_SIZE,
+    read_text,
+    stream,
+    fetch_bytes,
+    fetch_text,
+    read_attachment,
+)
+from .diff import (
+    DiffTimeout,
+    get_opcodes,
+    unified_diff,
+    diff_in_thread,
+)
+from .history import (
+    FileRevision,
+    ensure_history_indexes,
+    record_revision,
+    list_revisions,
+    load_revision,
+)
+from .outline import PYTHON_EXTENSIONS, Symbol, build_outline, outline
+from .search import (
+    FileTokens,
+    ensure_search_indexes,
+    backfill_search,
+    index_file,
+    delete_tokens,
+    search,
+)
 from .utils import *
+from .archive import (
+    ArchiveError,
+    ARCHIVE_SUFFIXES,
+    ARCHIVE_MAX_UPLOAD,
+    archive_stem,
+    spool,
+    import_archive,
+    export_archive,
+)
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from odmantic import AIOEngine
+from pymongo import ASCENDING, UpdateOne
+from typing import IO, Iterator
+
+from .blobs import CHUNK_SIZE, load_blob
+from .fetch import FetchError, stream
+from .search import build_postings, index_postings
+from .storage import FileModel, ancestors_of, delete_folder, folder_path, list_subtree
+from .utils import File
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+ARCHIVE_MAX_FILES = 500
+ARCHIVE_MAX_BYTES = 32 * 1024 * 1024  # uncompressed, across the whole archive
+ARCHIVE_MAX_FILE_BYTES = 4 * 1024 * 1024
+ARCHIVE_MAX_UPLOAD = 8 * 1024 * 1024
+EXPORT_MAX_SIZE = CHUNK_SIZE  # the finished archive is sent as a single attachment
+IMPORT_BATCH = 100
+MAX_NAME_LENGTH = 12  # the same limit as naming a file or folder by hand
+SPOOL_SIZE = 1024 * 1024  # archives bigger than this are spooled to disk
+
+
+class ArchiveError(Exception):
+    """An archive is malformed or over one of the import/export caps"""
+
+    def __init__(self, argument: str) -> None:
+        super().__init__(f"{argument}")
+
+
+def archive_stem(filename: str) -> str:
+    for suffix in ARCHIVE_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return filename[: -len(suffix)]
+    return filename
+
+
+async def spool(url: str, limit: int = ARCHIVE_MAX_UPLOAD) -> IO[bytes]:
+    """Stream `url` into a temporary file, failing as soon as it grows past `limit` bytes."""
+    fp = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        async for data in stream(url, limit=limit):
+            fp.write(data)
+    except FetchError as e:
+        fp.close()
+        raise ArchiveError(str(e))
+    except BaseException:
+        fp.close()
+        raise
+    fp.seek(0)
+    return fp
+
+
+def _read_member(handle: IO[bytes], declared: int, path: str) -> bytes:
+    if declared > ARCHIVE_MAX_FILE_BYTES:
+        raise ArchiveError(f"{path} is over {ARCHIVE_MAX_FILE_BYTES // 1024 // 1024} MB!")
+    # the declared size can lie, so never read more than the cap allows
+    data = handle.read(ARCHIVE_MAX_FILE_BYTES + 1)
+    if len(data) > ARCHIVE_MAX_FILE_BYTES:
+        raise ArchiveError(f"{path} is over {ARCHIVE_MAX_FILE_BYTES // 1024 // 1024} MB!")
+    return data
+
+
+def _clean_parts(path: str) -> list[str]:
+    # drops empty, "." and ".." parts so nothing lands outside the import folder
+    return [part for part in path.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+
+
+def _check_path(path: str, parts: list[str], seen: set[tuple[str, ...]]) -> None:
+    """Refuse a member whose cleaned path couldn't be saved, or repeats an earlier one."""
+    for part in parts:
+        if len(part) > MAX_NAME_LENGTH:
+            raise ArchiveError(
+                f"{path}: file and folder names can be at most {MAX_NAME_LENGTH} characters!"
+            )
+        if part.startswith("folder: "):
+            raise ArchiveError(f'{path}: names can\'t start with "folder: "!')
+    if tuple(parts) in seen:
+        raise ArchiveError(f"{path} is in the archive more than once!")
+    seen.add(tuple(parts))
+
+
+def _members(fp: IO[bytes], filename: str) -> Iterator[tuple[list[str], bytes]]:
+    """Yield ``(parts, data)`` for every regular file in the archive, one at a time.
+
+    `parts` are the cleaned folder and file names of the member's path. Blocking;
+    it is stepped through from a worker thread. Only the current member is ever
+    held in memory, and the caps and path checks are enforced here, before the
+    member is yielded.
+    """
+    count = total = 0
+    seen: set[tuple[str, ...]] = set()
+
+    def check(path: str, data: bytes) -> tuple[list[str], bytes]:
+        nonlocal count, total
+        count += 1
+        total += len(data)
+        if count > ARCHIVE_MAX_FILES:
+            raise ArchiveError(f"Archives can hold at most {ARCHIVE_MAX_FILES} files!")
+        if total > ARCHIVE_MAX_BYTES:
+            raise ArchiveError(f"Archives can hold at most {ARCHIVE_MAX_BYTES // 1024 // 1024} MB!")
+        return _clean_parts(path), data
+
+    try:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(fp) as archive:
+                infos = [
+                    info
+                    for info in archive.infolist()
+                    if not info.is_dir() and _clean_parts(info.filename)
+                ]
+                # the central directory lists every member up front, so an archive
+                # over the caps is refused before the first file is uploaded
+                if len(infos) > ARCHIVE_MAX_FILES:
+                    raise ArchiveError(f"Archives can hold at most {ARCHIVE_MAX_FILES} files!")
+                if sum(info.file_size for info in infos) > ARCHIVE_MAX_BYTES:
+                    raise ArchiveError(f"Archives can hold at most {ARCHIVE_MAX_BYTES // 1024 // 1024} MB!")
+                for info in infos:
+                    if info.file_size > ARCHIVE_MAX_FILE_BYTES:
+                        raise ArchiveError(f"{info.filename} is over {ARCHIVE_MAX_FILE_BYTES // 1024 // 1024} MB!")
+                    _check_path(info.filename, _clean_parts(info.filename), seen)
+
+                for info in infos:
+                    with archive.open(info) as handle:
+                        data = _read_member(handle, info.file_size, info.filename)
+                    yield check(info.filename, data)
+        else:
+            # "r|*" reads the tar strictly front to back, without seeking
+            with tarfile.open(fileobj=fp, mode="r|*") as archive:
+                for member in archive:
+                    if not member.isfile() or not _clean_parts(member.name):
+                        continue
+                    _check_path(member.name, _clean_parts(member.name), seen)
+                    data = _read_member(archive.extractfile(member), member.size, member.name)
+                    yield check(member.name, data)
+    except (zipfile.BadZipFile, tarfile.TarError) as error:
+        raise ArchiveError(f"That archive is corrupted! ({error})")
+
+
+def _upsert(user_id: int, folder: str, name: str, fields: dict, now: float) -> UpdateOne:
+    return UpdateOne(
+        {"user_id": user_id, "folder": folder, "name": name},
+        {
+            "$set": {**fields, "ancestors": ancestors_of(folder), "last_edit_epoch": now},
+            "$setOnInsert": {"create_epoch": now},
+        },
+        upsert=True,
+    )
+
+
+async def import_archive(
+    bot, engine: AIOEngine, user_id: int, fp: IO[bytes], filename: str, root: str
+) -> dict[str, int]:
+    """Unpack the archive in `fp` into the saved files below the folder `root`.
+
+    Members are read, uploaded and written one at a time, and the documents are
+    upserted in bulk batches of `IMPORT_BATCH`, along with their search postings.
+    Files that aren't valid UTF-8 are skipped. If the import fails part way, every
+    document already written below `root` is deleted again. Returns how many files
+    were imported and skipped, and their total size.
+    """
+    collection = engine.get_collection(FileModel)
+    members = _members(fp, filename)
+    folders: set[str] = set()
+    requests = []
+    postings = {}  # request index -> search postings of the file it writes
+    imported = skipped = size = 0
+    now = time.time()
+
+    def add_folders(path: str) -> None:
+        # every folder between `/` and `path` needs its own "folder: " document
+        for folder in ancestors_of(path)[1:]:
+            if folder not in folders:
+                folders.add(folder)
+                parent, _, name = folder[:-1].rpartition("/")
+                requests.append(_upsert(user_id, parent + "/", "folder: " + name, {}, now))
+
+    async def flush() -> None:
+        nonlocal requests, postings
+        result = await collection.bulk_write(requests, ordered=False)
+        # the import folder is new, so every file is an insert with an upserted id
+        await index_postings(
+            engine,
+            user_id,
+            {
+                file_id: postings[index]
+                for index, file_id in result.upserted_ids.items()
+                if index in postings
+            },
+        )
+        requests, postings = [], {}
+
+    try:
+        add_folders(root)
+        while (member := await asyncio.to_thread(next, members, None)) is not None:
+            parts, data = member
+            try:
+                file_ = File(filename=parts[-1], content=data.decode("utf-8"), bot=bot)
+            except UnicodeDecodeError:
+                skipped += 1
+                continue
+
+            folder = root + "".join(folder_path("", part) for part in parts[:-1])
+            add_folders(folder)
+            await file_.store()
+            postings[len(requests)] = await asyncio.to_thread(build_postings, file_.content)
+            requests.append(
+                _upsert(
+                    user_id,
+                    folder,
+                    file_.filename,
+                    {"file_url": file_.url, **file_.describe(), **file_.storage_info()},
+                    now,
+                )
+            )
+            imported += 1
+            size += len(data)
+            if len(requests) >= IMPORT_BATCH:
+                await flush()
+
+        if requests:
+            await flush()
+    except BaseException:
+        # leave nothing half imported behind; the import folder was new
+        parent, _, name = root[:-1].rpartition("/")
+        await delete_folder(engine, user_id, parent + "/", name)
+        raise
+    return {"imported": imported, "skipped": skipped, "size": size}
+
+
+async def export_archive(engine: AIOEngine, user_id: int, path: str = "/") -> IO[bytes]:
+    """Zip every saved file below the folder `path` into a temporary file.
+
+    Files are downloaded and compressed into the archive one at a time, so only
+    one file's content is held in memory. The file count and size caps are checked
+    against the stored metadata before anything is downloaded.
+    """
+    fp = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    count = total = 0
+    try:
+        with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            async for document in list_subtree(
+                engine,
+                user_id,
+                path,
+                projection={
+                    "folder": True,
+                    "name": True,
+                    "file_url": True,
+                    "chunks": True,
+                    "codec": True,
+                    "size": True,
+                },
+            ).sort([("folder", ASCENDING), ("name", ASCENDING)]):
+                if not document.get("file_url"):
+                    continue
+                count += 1
+                total += document.get("size") or 0
+                if count > ARCHIVE_MAX_FILES:
+                    raise ArchiveError(f"Exports can hold at most {ARCHIVE_MAX_FILES} files!")
+                if total > ARCHIVE_MAX_BYTES:
+                    raise ArchiveError(f"Exports can hold at most {ARCHIVE_MAX_BYTES // 1024 // 1024} MB!")
+
+                data = await load_blob(
+                    document["file_url"], document.get("chunks"), document.get("codec")
+                )
+                name = document["folder"][len(path):] + document["name"]
+                await asyncio.to_thread(archive.writestr, name, bytes(data))
+                if fp.tell() > EXPORT_MAX_SIZE:
+                    raise ArchiveError(f"The export is over {EXPORT_MAX_SIZE // 1024 // 1024} MB!")
+    except BaseException:
+        fp.close()
+        raise
+    fp.seek(0)
+    return fp
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import disnake
+import hashlib
+import io
+import random
+import zlib
+
+from disnake.ext import commands
+from typing import Optional
+
+from .fetch import fetch_bytes
+
+CHUNK_SIZE = 7 * 1024 * 1024  # stays under the 8 MB attachment limit
+TRANSFER_CONCURRENCY = 3
+COMPRESSION_THRESHOLD = 4 * 1024  # smaller files aren't worth a codec round-trip
+CODECS = {"zlib": (zlib.compress, zlib.decompress)}
+DOWNLOAD_LIMIT = 8 * 1024 * 1024  # files saved before chunking are single attachments
+
+
+class IntegrityError(Exception):
+    """A downloaded chunk does not match the hash in its manifest"""
+
+    def __init__(self, argument: str) -> None:
+        super().__init__(f"{argument}")
+
+
+async def download(url: str, limit: int = DOWNLOAD_LIMIT) -> bytes:
+    return await fetch_bytes(url, limit=limit)
+
+
+async def upload_blob(bot: commands.Bot, filename: str, data: bytes) -> list[dict]:
+    """Upload `data` as attachments of at most `CHUNK_SIZE` bytes each.
+
+    Returns the manifest: the url, size and sha256 of every chunk, and the message
+    holding it, in order.
+    """
+    chunks = [data[i: i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)] or [b""]
+    semaphore = asyncio.Semaphore(TRANSFER_CONCURRENCY)
+
+    async def upload(index: int, chunk: bytes) -> dict:
+        name = filename if len(chunks) == 1 else f"{filename}.{index:03}"
+        async with semaphore:
+            channel = random.choice(bot.send_guild.text_channels)
+            message = await channel.send(file=disnake.File(fp=io.BytesIO(chunk), filename=name))  # type: ignore
+        return {
+            "url": message.attachments[0].url,
+            "size": len(chunk),
+            "sha256": hashlib.sha256(chunk).hexdigest(),
+            "channel_id": channel.id,
+            "message_id": message.id,
+        }
+
+    return list(await asyncio.gather(*(upload(i, c) for i, c in enumerate(chunks))))
+
+
+async def delete_blob(bot: commands.Bot, manifest: list[dict]) -> int:
+    """Delete the messages holding the chunks in `manifest`.
+
+    Chunks uploaded before their message was recorded in the manifest are left
+    alone. Returns the number of deleted chunks.
+    """
+    deleted = 0
+    for chunk in manifest:
+        channel = bot.get_channel(chunk.get("channel_id"))
+        if channel is None or "message_id" not in chunk:
+            continue
+        try:
+            await channel.get_partial_message(chunk["message_id"]).delete()
+        except disnake.NotFound:
+            continue
+        deleted += 1
+    return deleted
+
+
+async def download_blob(manifest: list[dict]) -> bytearray:
+    """Download every chunk in `manifest` concurrently and verify it against its hash.
+
+    Each chunk is written straight into its slot of one preallocated buffer, so the
+    chunks never have to be joined afterwards.
+    """
+    buffer = bytearray(sum(chunk["size"] for chunk in manifest))
+    offsets = [0]
+    for chunk in manifest[:-1]:
+        offsets.append(offsets[-1] + chunk["size"])
+    semaphore = asyncio.Semaphore(TRANSFER_CONCURRENCY)
+
+    async def fetch(index: int, chunk: dict) -> None:
+        async with semaphore:
+            data = await download(chunk["url"], chunk["size"])
+        if len(data) != chunk["size"] or hashlib.sha256(data).hexdigest() != chunk["sha256"]:
+            raise IntegrityError(f"Chunk {index} of this file is corrupted!")
+        buffer[offsets[index]: offsets[index] + len(data)] = data
+
+    await asyncio.gather(*(fetch(i, c) for i, c in enumerate(manifest)))
+    return buffer
+
+
+async def compress(data: bytes) -> tuple[Optional[str], bytes]:
+    """Compress `data` in a worker thread if it is large enough and actually shrinks."""
+    if len(data) < COMPRESSION_THRESHOLD:
+        return None, data
+    compressed = await asyncio.to_thread(CODECS["zlib"][0], data)
+    if len(compressed) >= len(data):
+        return None, data
+    return "zlib", compressed
+
+
+async def decompress(codec: Optional[str], data: bytes | bytearray) -> bytes | bytearray:
+    if codec is None:
+        return data
+    return await asyncio.to_thread(CODECS[codec][1], data)
+
+
+async def store_blob(bot: commands.Bot, filename: str, data: bytes) -> dict:
+    """Compress and upload `data`, returning what is needed to load it again."""
+    codec, payload = await compress(data)
+    chunks = await upload_blob(
+        bot, filename if codec is None else f"{filename}.{codec}", payload
+    )
+    return {"chunks": chunks, "codec": codec, "stored_size": len(payload)}
+
+
+async def load_blob(
+    url: str, manifest: Optional[list[dict]] = None, codec: Optional[str] = None
+) -> bytes | bytearray:
+    """Load a stored file, reassembling it from chunks and decompressing it as needed."""
+    if manifest:
+        return await decompress(codec, await download_blob(manifest))
+    return await decompress(codec, await download(url))
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from typing import Iterator
+
+
+class DiffTimeout(Exception):
+    """The diff did not finish within its time budget"""
+
+    def __init__(self, argument: str) -> None:
+        super().__init__(f"{argument}")
+
+
+def _myers(a: list[str], b: list[str], deadline: float) -> list[tuple[str, int, int]]:
+    """Find a shortest edit script from `a` to `b` with Myers' O(ND) algorithm.
+
+    Returns ``(op, i, j)`` steps in order, where ``op`` is ``"="``, ``"-"`` or ``"+"``.
+    """
+    n, m = len(a), len(b)
+    offset = n + m + 1
+    v = [0] * (2 * offset + 1)
+    trace = []
+    for d in range(n + m + 1):
+        if time.monotonic() > deadline:
+            raise DiffTimeout("The files are too different to diff in time!")
+        # only diagonals -d..d can be read back for this step, so only they are kept
+        trace.append(v[offset - d: offset + d + 1])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return []
+
+
+def _backtrack(trace: list[list[int]], x: int, y: int) -> list[tuple[str, int, int]]:
+    steps = []
+    for d in range(len(trace) - 1, -1, -1):
+        # trace[d] holds diagonals -d..d, so diagonal k is at index k + d
+        v = trace[d]
+        k = x - y
+        if d == 0:
+            previous_x = previous_y = 0
+        else:
+            if k == -d or (k != d and v[k - 1 + d] < v[k + 1 + d]):
+                previous_k = k + 1
+            else:
+                previous_k = k - 1
+            previous_x = v[previous_k + d]
+            previous_y = previous_x - previous_k
+
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            steps.append(("=", x, y))
+        if d > 0:
+            if x == previous_x:
+                steps.append(("+", x, previous_y))
+            else:
+                steps.append(("-", previous_x, y))
+        x, y = previous_x, previous_y
+    steps.reverse()
+    return steps
+
+
+def get_opcodes(a: list[str], b: list[str], budget: float = 2.0) -> list[tuple[str, int, int, int, int]]:
+    """Diff two lists of lines into ``difflib``-style opcodes within `budget` seconds."""
+    prefix = 0
+    while prefix < min(len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < min(len(a), len(b)) - prefix
+        and a[len(a) - suffix - 1] == b[len(b) - suffix - 1]
+    ):
+        suffix += 1
+
+    # Myers only has to look at the part in between the common prefix and suffix.
+    middle = _myers(
+        a[prefix: len(a) - suffix], b[prefix: len(b) - suffix], time.monotonic() + budget
+    )
+
+    opcodes = []
+    if prefix:
+        opcodes.append(["equal", 0, prefix, 0, prefix])
+    i, j = prefix, prefix
+    for op, _, _ in middle:
+        tag = "equal" if op == "=" else "replace"
+        if opcodes and opcodes[-1][0] == tag:
+            opcode = opcodes[-1]
+        else:
+            opcode = [tag, i, i, j, j]
+            opcodes.append(opcode)
+        if op != "+":
+            i += 1
+        if op != "-":
+            j += 1
+        opcode[2], opcode[4] = i, j
+    if suffix:
+        if opcodes and opcodes[-1][0] == "equal":
+            opcodes[-1][2] += suffix
+            opcodes[-1][4] += suffix
+        else:
+            opcodes.append(["equal", i, i + suffix, j, j + suffix])
+
+    for opcode in opcodes:
+        if opcode[0] == "replace" and opcode[1] == opcode[2]:
+            opcode[0] = "insert"
+        elif opcode[0] == "replace" and opcode[3] == opcode[4]:
+            opcode[0] = "delete"
+    return [tuple(opcode) for opcode in opcodes]
+
+
+def _grouped(opcodes: list[tuple], context: int) -> Iterator[list[tuple]]:
+    if not opcodes:
+        return
+    opcodes = list(opcodes)
+    tag, i1, i2, j1, j2 = opcodes[0]
+    if tag == "equal":
+        opcodes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    tag, i1, i2, j1, j2 = opcodes[-1]
+    if tag == "equal":
+        opcodes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal" and i2 - i1 > context * 2:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _range(start: int, stop: int) -> str:
+    # an empty range names the line before it, so inserting at the top is "0,0"
+    length = stop - start
+    if length == 1:
+        return f"{start + 1}"
+    return f"{start + 1 if length else start},{length}"
+
+
+def unified_diff(
+    a: list[str],
+    b: list[str],
+    from_name: str = "a",
+    to_name: str = "b",
+    *,
+    context: int = 3,
+    budget: float = 2.0,
+) -> list[str]:
+    """Render a unified diff of two lists of lines, without line endings."""
+    lines = []
+    for group in _grouped(get_opcodes(a, b, budget), context):
+        if not lines:
+            lines += [f"--- {from_name}", f"+++ {to_name}"]
+        first, last = group[0], group[-1]
+        lines.append(
+            f"@@ -{_range(first[1], last[2])} +{_range(first[3], last[4])} @@"
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines += [" " + line for line in a[i1:i2]]
+                continue
+            lines += ["-" + line for line in a[i1:i2]]
+            lines += ["+" + line for line in b[j1:j2]]
+    return lines
+
+
+async def diff_in_thread(
+    a: str, b: str, from_name: str = "a", to_name: str = "b", *, budget: float = 2.0
+) -> list[str]:
+    """Diff two texts in a worker thread so large files don't block the bot."""
+    return await asyncio.to_thread(
+        unified_diff, a.splitlines(), b.splitlines(), from_name, to_name, budget=budget
+    )
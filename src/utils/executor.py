@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import aiohttp
+import ast
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import statistics
+
+from typing import Optional
+
+PISTON_URL = "https://emkc.org/api/v1/piston/execute"
+
+BENCHMARK_RUNS = 100
+BENCHMARK_WARMUP = 2
+BENCHMARK_BUDGET = 2.0
+BENCHMARK_MIN_P95_RUNS = 20  # below this the 95th percentile is just the slowest run
+PROFILE_TOP = 15
+PROFILE_BUDGET = 2.0
+
+COMPILED_LANGUAGES = ("c", "cpp", "rs", "go")
+COMPILE_CACHE_DIR = os.path.join(".cache", "compile")
+COMPILE_CACHE_BUDGET = 16 * 1024 * 1024
+RESULT_MARKER = "__jarvide_result__"
+
+# Diagnostics only the compiler prints; a failed run without one of these is a
+# runtime error, a timeout or a signal, and is not replayed from the cache.
+COMPILE_ERRORS = {
+    "c": re.compile(r"^\S+:\d+:\d+: (?:fatal )?error: ", re.MULTILINE),
+    "cpp": re.compile(r"^\S+:\d+:\d+: (?:fatal )?error: ", re.MULTILINE),
+    "rs": re.compile(r"^error(?:\[E\d{4}\])?: ", re.MULTILINE),
+    "go": re.compile(r"^\S+\.go:\d+:\d+: ", re.MULTILINE),
+}
+KILLED_MARKERS = ("Killed", "Terminated", "timed out", "signal")
+
+# Runs inside the executor, so every run shares the limits of a normal Run. Runs
+# stop early once the budget is spent, so slow programs still fit those limits.
+_PYTHON_BENCHMARK = """\
+import io, json, resource, sys, time
+_source = {source!r}
+_code = compile(_source, {filename!r}, "exec")
+_wall, _cpu, _error = [], [], None
+_begin = time.perf_counter()
+for _ in range({total}):
+    _stdout, sys.stdout = sys.stdout, io.StringIO()
+    _start_wall, _start_cpu = time.perf_counter(), time.process_time()
+    try:
+        exec(_code, {{"__name__": "__main__"}})
+    except SystemExit:
+        pass
+    except BaseException as e:
+        _error = f"{{type(e).__name__}}: {{e}}"
+    finally:
+        _end_wall, _end_cpu = time.perf_counter(), time.process_time()
+        sys.stdout = _stdout
+    if _error:
+        break
+    _wall.append(_end_wall - _start_wall)
+    _cpu.append(_end_cpu - _start_cpu)
+    if _end_wall - _begin > {budget}:
+        break
+_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print({marker!r} + json.dumps({{"wall": _wall, "cpu": _cpu, "peak_kb": _peak, "error": _error}}))
+"""
+
+# The itimer stops the profiled program once the budget is spent so the profiler's
+# overhead can never push a run past the executor's own time limit.
+_PYTHON_PROFILE = """\
+import cProfile, io, json, os, pstats, signal, sys
+class _Budget(BaseException):
+    pass
+def _stop(*_):
+    raise _Budget
+_code = compile({source!r}, {filename!r}, "exec")
+_profiler, _error, _truncated = cProfile.Profile(), None, False
+_stdout, sys.stdout = sys.stdout, io.StringIO()
+signal.signal(signal.SIGALRM, _stop)
+signal.setitimer(signal.ITIMER_REAL, {budget})
+_profiler.enable()
+try:
+    exec(_code, {{"__name__": "__main__"}})
+except _Budget:
+    _truncated = True
+except SystemExit:
+    pass
+except BaseException as e:
+    _error = f"{{type(e).__name__}}: {{e}}"
+finally:
+    _profiler.disable()
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    sys.stdout = _stdout
+_rows = [
+    [func[:40], os.path.basename(file)[:20], line, calls, self_, total]
+    for (file, line, func), (_, calls, self_, total, _) in pstats.Stats(_profiler).stats.items()
+    if func not in ("_stop", "<method 'disable' of '_lsprof.Profiler' objects>")
+]
+print({marker!r} + json.dumps({{
+    "cumulative": sorted(_rows, key=lambda r: r[5], reverse=True)[:{top}],
+    "self": sorted(_rows, key=lambda r: r[4], reverse=True)[:{top}],
+    "functions": len(_rows),
+    "error": _error,
+    "truncated": _truncated,
+}}))
+"""
+
+
+class ExecutionError(Exception):
+    """The executor could not run the source"""
+
+    def __init__(self, argument: str) -> None:
+        super().__init__(f"{argument}")
+
+
+class CompileCache:
+    """An on-disk cache of compile results, evicted least recently used first.
+
+    Compilation happens inside the executor, so the artifacts themselves never reach
+    us. What is deterministic is a compile failure: the same source and flags fail
+    the same way every time, so those results are replayed without a round-trip.
+
+    Successful runs are not cached. Piston takes only source and compiles it again
+    for every request, with no way to hand it a built artifact or a key to one, and
+    a program's output can change between runs.
+    """
+
+    def __init__(self, directory: str, budget: int) -> None:
+        self.directory = directory
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(language: str, source: str, flags: tuple[str, ...] = ()) -> str:
+        digest = hashlib.sha256()
+        for part in (PISTON_URL, language, *flags, source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                result = json.load(f)
+            # inside the try, since a concurrent eviction may remove the file first
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def _store(self, key: str, result: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(key), "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.budget:
+                break
+            os.remove(path)
+            total -= size
+
+    async def get(self, key: str) -> Optional[dict]:
+        result = await asyncio.to_thread(self._load, key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def put(self, key: str, result: dict) -> None:
+        await asyncio.to_thread(self._store, key, result)
+
+
+compile_cache = CompileCache(COMPILE_CACHE_DIR, COMPILE_CACHE_BUDGET)
+
+
+def compile_failed(language: str, json_: dict) -> bool:
+    """Whether `json_` is a failure of the compile stage itself.
+
+    Piston v1 doesn't report the stages separately, so this looks for a compiler
+    diagnostic in stderr. Anything killed by a signal or the time limit is never
+    treated as a compile failure, since it might pass on the next run.
+    """
+    if json_.get("ran") is not False or json_.get("stdout") or json_.get("signal"):
+        return False
+    stderr = json_.get("stderr") or ""
+    if any(marker in stderr for marker in KILLED_MARKERS):
+        return False
+    pattern = COMPILE_ERRORS.get(language)
+    return pattern is not None and pattern.search(stderr) is not None
+
+
+async def execute(language: str, source: str) -> dict:
+    if language in COMPILED_LANGUAGES:
+        key = compile_cache.key(language, source)
+        cached = await compile_cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            url=PISTON_URL,
+            json={"language": language, "source": source},
+        ) as data:
+            json_ = await data.json()
+
+    if language in COMPILED_LANGUAGES and compile_failed(language, json_):
+        await compile_cache.put(key, json_)
+    return json_
+
+
+async def check_syntax(source: str, filename: str = "<unknown>") -> Optional[SyntaxError]:
+    """Parse a Python `source` in a worker thread and return its syntax error, if any."""
+    try:
+        await asyncio.to_thread(ast.parse, source, filename)
+    except SyntaxError as e:
+        return e
+    return None
+
+
+def check_response(json_: dict) -> None:
+    if "message" in json_ and "runtime is unknown" in json_["message"]:
+        raise ExecutionError(
+            "This file has an invalid file extension and therefore I do not know what language to run it in! Try renaming your file"
+        )
+    if "output" not in json_:
+        raise ExecutionError("Something went wrong! Maybe the file is too long!")
+
+
+def extract_result(output: str) -> Optional[dict]:
+    for line in reversed(output.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    return None
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: list[float]) -> dict[str, Optional[float]]:
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "p95": percentile(samples, 95) if len(samples) >= BENCHMARK_MIN_P95_RUNS else None,
+    }
+
+
+async def benchmark(
+    source: str,
+    *,
+    filename: str = "<benchmark>",
+    runs: int = BENCHMARK_RUNS,
+    warmup: int = BENCHMARK_WARMUP,
+    budget: float = BENCHMARK_BUDGET,
+) -> dict:
+    """Run a Python `source` up to `runs` times after `warmup` discarded runs.
+
+    The runs are timed inside the executor, so wall time, CPU time and peak memory
+    are measured without the round-trip. Runs stop once `budget` seconds are spent,
+    and the 95th percentile is only reported with at least `BENCHMARK_MIN_P95_RUNS`
+    timed runs.
+    """
+    json_ = await execute(
+        "py",
+        _PYTHON_BENCHMARK.format(
+            source=source,
+            filename=filename,
+            total=runs + warmup,
+            budget=budget,
+            marker=RESULT_MARKER,
+        ),
+    )
+    check_response(json_)
+    result = extract_result(json_["output"])
+    if result is None:
+        raise ExecutionError(
+            "The benchmark did not finish within the executor's limits! Try a faster program."
+        )
+    if result["error"]:
+        raise ExecutionError(f"Your program raised {result['error']}")
+    if len(result["wall"]) <= warmup:
+        raise ExecutionError(
+            f"Your program is too slow to benchmark in {budget:g} seconds! Try a faster program."
+        )
+
+    return {
+        "runs": len(result["wall"][warmup:]),
+        "warmup": warmup,
+        "wall": summarize(result["wall"][warmup:]),
+        "cpu": summarize(result["cpu"][warmup:]),
+        "peak_kb": result["peak_kb"],
+    }
+
+
+def format_benchmark(filename: str, result: dict) -> str:
+    def cell(value: Optional[float]) -> str:
+        return f"{'n/a':>12}" if value is None else f"{value * 1000:>9.3f} ms"
+
+    def row(name: str, stats: dict[str, Optional[float]]) -> str:
+        return f"{name:<6}" + "".join(cell(stats[key]) for key in ("min", "median", "p95"))
+
+    note = (
+        ""
+        if result["runs"] >= BENCHMARK_MIN_P95_RUNS
+        else f"\np95 needs at least {BENCHMARK_MIN_P95_RUNS} runs; the program was too slow for that."
+    )
+    return (
+        f"Benchmark: {filename} ({result['runs']} runs, {result['warmup']} warm-up runs discarded)\n"
+        f"{'':<6}{'min':>12}{'median':>12}{'p95':>12}\n"
+        f"{row('wall', result['wall'])}\n"
+        f"{row('cpu', result['cpu'])}\n"
+        f"Peak memory: {result['peak_kb']:,} KB{note}"
+    )
+
+
+async def profile(
+    source: str,
+    *,
+    filename: str = "<profile>",
+    top: int = PROFILE_TOP,
+    budget: float = PROFILE_BUDGET,
+) -> dict:
+    """Run a Python `source` under cProfile inside the executor.
+
+    Only the `top` functions by cumulative and by self time are sent back, and the
+    program is stopped after `budget` seconds of profiling.
+    """
+    json_ = await execute(
+        "py",
+        _PYTHON_PROFILE.format(
+            source=source,
+            filename=filename,
+            budget=budget,
+            top=top,
+            marker=RESULT_MARKER,
+        ),
+    )
+    check_response(json_)
+    result = extract_result(json_["output"])
+    if result is None:
+        raise ExecutionError(
+            "The profiler did not finish within the executor's limits! Try a faster program."
+        )
+    return result
+
+
+def format_profile(result: dict) -> list[str]:
+    def rows(title: str, key: str) -> list[str]:
+        lines = [
+            f"\n{title}",
+            f"\n{'cumtime':>9} {'tottime':>9} {'ncalls':>8}  function",
+        ]
+        for func, file, line, calls, self_, total in result[key]:
+            lines.append(f"\n{total:>9.4f} {self_:>9.4f} {calls:>8}  {func} ({file}:{line})")
+        return lines
+
+    header = [f"Profiled {result['functions']} functions"]
+    if result["truncated"]:
+        header.append("\nStopped early: the profiling time budget was used up")
+    if result["error"]:
+        header.append(f"\nYour program raised {result['error']}")
+    return (
+        header
+        + rows("Top functions by cumulative time:", "cumulative")
+        + ["\n"]
+        + rows("Top functions by self time:", "self")
+    )
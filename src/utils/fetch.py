@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import aiohttp
+import asyncio
+import codecs
+import disnake
+
+from typing import AsyncIterator, Optional
+
+MAX_TEXT_SIZE = 4 * 1024 * 1024
+READ_SIZE = 64 * 1024
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30  # between two reads, not for the whole body
+MAX_REDIRECTS = 5
+BINARY_TYPES = (
+    "image/",
+    "audio/",
+    "video/",
+    "font/",
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "application/x-tar",
+)
+BOMS = (
+    # the utf-32 boms start with the utf-16 ones, so they have to be checked first
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+FALLBACK_ENCODING = "cp1252"
+TEXT_CONTROL = {"\t", "\n", "\r", "\f", "\v", "\x1b"}
+
+
+class FetchError(Exception):
+    """Remote content is too large, unreachable or not text"""
+
+    def __init__(self, argument: str) -> None:
+        super().__init__(f"{argument}")
+
+
+def sniff_encoding(head: bytes) -> tuple[str, int]:
+    """Guess the encoding of content starting with `head`, and the length of its BOM."""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return "utf-8", 0
+
+
+def looks_binary(text: str) -> bool:
+    control = sum(1 for char in text if char < " " and char not in TEXT_CONTROL)
+    return "\x00" in text or control > len(text) // 100
+
+
+async def read_text(chunks: AsyncIterator[bytes], limit: int = MAX_TEXT_SIZE) -> str:
+    """Decode a stream of byte chunks into text, holding at most `limit` bytes.
+
+    The encoding is sniffed from the first chunk and the chunks are decoded
+    incrementally. Binary content is refused after the first chunk, and anything
+    past `limit` bytes as soon as it arrives.
+    """
+    decoder = None
+    parts = []
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > limit:
+            raise FetchError(f"That file is over {limit // 1024 // 1024} MB!")
+
+        if decoder is None:
+            encoding, bom = sniff_encoding(chunk)
+            chunk = chunk[bom:]
+            try:
+                decoder = codecs.getincrementaldecoder(encoding)()
+                text = decoder.decode(chunk)
+            except UnicodeDecodeError:
+                if bom:
+                    raise FetchError("That file isn't valid text!")
+                # no bom and not utf-8: most likely a legacy windows text file
+                decoder = codecs.getincrementaldecoder(FALLBACK_ENCODING)(errors="replace")
+                text = decoder.decode(chunk)
+            if looks_binary(text):
+                raise FetchError("That looks like a binary file, upload a text file!")
+            parts.append(text)
+            continue
+
+        try:
+            parts.append(decoder.decode(chunk))
+        except UnicodeDecodeError:
+            raise FetchError("That file isn't valid text!")
+
+    if decoder is None:
+        return ""
+    try:
+        parts.append(decoder.decode(b"", final=True))
+    except UnicodeDecodeError:
+        raise FetchError("That file isn't valid text!")
+    return "".join(parts)
+
+
+async def stream(
+    url: str,
+    *,
+    limit: int,
+    headers: Optional[dict] = None,
+    text: bool = False,
+) -> AsyncIterator[bytes]:
+    """Yield the body of `url` in chunks, never more than `limit` bytes in total.
+
+    Connecting and every read are timed out and redirects are capped. A body
+    declaring a larger `Content-Length` is refused before it is read, and with
+    `text` so is a binary content type.
+    """
+    timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    size = 0
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(url, headers=headers, max_redirects=MAX_REDIRECTS) as response:
+                if response.status == 404:
+                    raise FetchError("That file doesn't exist!")
+                if response.status >= 400:
+                    raise FetchError(f"Couldn't fetch that file! (HTTP {response.status})")
+                if (response.content_length or 0) > limit:
+                    raise FetchError(f"That file is over {limit // 1024 // 1024} MB!")
+                if text and response.content_type.startswith(BINARY_TYPES):
+                    raise FetchError(f"That is a {response.content_type} file, not text!")
+
+                async for chunk in response.content.iter_chunked(READ_SIZE):
+                    size += len(chunk)
+                    if size > limit:
+                        raise FetchError(f"That file is over {limit // 1024 // 1024} MB!")
+                    yield chunk
+    except aiohttp.TooManyRedirects:
+        raise FetchError("That link redirects too many times!")
+    except asyncio.TimeoutError:
+        raise FetchError("That link took too long to respond!")
+    except aiohttp.ClientError as e:
+        raise FetchError(f"Couldn't fetch that file! ({e.__class__.__name__})")
+
+
+async def fetch_bytes(url: str, *, limit: int, headers: Optional[dict] = None) -> bytes:
+    data = bytearray()
+    async for chunk in stream(url, limit=limit, headers=headers):
+        data += chunk
+    return bytes(data)
+
+
+async def fetch_text(
+    url: str, *, limit: int = MAX_TEXT_SIZE, headers: Optional[dict] = None
+) -> str:
+    """Download and decode a text file, see `stream` and `read_text`."""
+    chunks = stream(url, limit=limit, headers=headers, text=True)
+    try:
+        return await read_text(chunks, limit)
+    finally:
+        # closes the connection right away when decoding gives up early
+        await chunks.aclose()
+
+
+async def read_attachment(attachment: disnake.Attachment, limit: int = MAX_TEXT_SIZE) -> str:
+    """Download and decode a text attachment, see `read_text`.
+
+    Attachments declaring a size over `limit` are refused without downloading them.
+    """
+    if attachment.size > limit:
+        raise FetchError(f"That file is over {limit // 1024 // 1024} MB!")
+    return await fetch_text(attachment.url, limit=limit)
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import difflib
+import time
+
+from bson import ObjectId
+from odmantic import AIOEngine, Model
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from typing import Optional
+
+from .blobs import load_blob
+
+SNAPSHOT_INTERVAL = 10  # at most this many deltas are replayed to rebuild a revision
+
+
+class FileRevision(Model):  # noqa
+    file_id: ObjectId
+    user_id: int
+    number: int
+    kind: str  # "full" or "delta"
+    content_hash: str
+    size: int
+    create_epoch: float
+    # full revisions point at the stored blob of the file as it was saved
+    file_url: Optional[str] = None
+    chunks: Optional[list[dict]] = None
+    codec: Optional[str] = None
+    # delta revisions hold the line operations that turn their parent into them
+    delta: Optional[list] = None
+
+
+REVISION_INDEXES = [
+    IndexModel(
+        [("file_id", ASCENDING), ("number", DESCENDING)],
+        name="file_number",
+        unique=True,
+    ),
+    IndexModel([("file_url", ASCENDING)], name="file_url", sparse=True),
+]
+
+
+async def ensure_history_indexes(engine: AIOEngine) -> list[str]:
+    return await engine.get_collection(FileRevision).create_indexes(REVISION_INDEXES)
+
+
+def make_delta(parent: str, content: str) -> list:
+    """Describe `content` as line operations on `parent`.
+
+    ``["=", start, end]`` copies lines ``start:end`` of the parent and ``["+", lines]``
+    inserts new lines, so only changed lines are stored.
+    """
+    parent_lines = parent.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, parent_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(["=", i1, i2])
+        elif j1 != j2:
+            delta.append(["+", lines[j1:j2]])
+    return delta
+
+
+def apply_delta(parent: str, delta: list) -> str:
+    parent_lines = parent.splitlines(keepends=True)
+    lines = []
+    for op in delta:
+        if op[0] == "=":
+            lines.extend(parent_lines[op[1]: op[2]])
+        else:
+            lines.extend(op[1])
+    return "".join(lines)
+
+
+def _delta_size(delta: list) -> int:
+    return sum(len(line) for op in delta if op[0] == "+" for line in op[1])
+
+
+async def record_revision(
+    engine: AIOEngine,
+    *,
+    file_id: ObjectId,
+    user_id: int,
+    content: str,
+    content_hash: str,
+    stored: dict,
+    parent_content: Optional[str] = None,
+    parent_hash: Optional[str] = None,
+) -> FileRevision:
+    """Record a save of `content` as the next revision of the file.
+
+    The revision is a delta against the previous one when that revision is known
+    to match `parent_content` and the delta is small; otherwise, and every
+    `SNAPSHOT_INTERVAL` revisions, it is a full snapshot of the stored blob.
+
+    Only full revisions keep a blob. The blob a delta revision was saved to is
+    released by the next save, see `release_blob`, so the history grows by the size
+    of the changes plus one snapshot every `SNAPSHOT_INTERVAL` saves.
+    """
+    collection = engine.get_collection(FileRevision)
+    head = await collection.find_one(
+        {"file_id": file_id},
+        sort=[("number", DESCENDING)],
+        projection={"number": True, "content_hash": True},
+    )
+    number = head["number"] + 1 if head else 1
+
+    delta = None
+    if head and parent_content is not None and head["content_hash"] == parent_hash:
+        last_full = await collection.find_one(
+            {"file_id": file_id, "kind": "full"},
+            sort=[("number", DESCENDING)],
+            projection={"number": True},
+        )
+        if last_full and number - last_full["number"] < SNAPSHOT_INTERVAL:
+            delta = make_delta(parent_content, content)
+            if _delta_size(delta) > len(content) // 2:
+                delta = None
+
+    revision = FileRevision(
+        file_id=file_id,
+        user_id=user_id,
+        number=number,
+        kind="full" if delta is None else "delta",
+        content_hash=content_hash,
+        size=len(content.encode("utf-8")),
+        create_epoch=time.time(),
+        delta=delta,
+        **(
+            {
+                "file_url": stored["chunks"][0]["url"],
+                "chunks": stored["chunks"],
+                "codec": stored["codec"],
+            }
+            if delta is None
+            else {}
+        ),
+    )
+    return await engine.save(revision)
+
+
+async def list_revisions(engine: AIOEngine, file_id: ObjectId) -> list[dict]:
+    return [
+        revision
+        async for revision in engine.get_collection(FileRevision)
+        .find(
+            {"file_id": file_id},
+            projection={"delta": False, "chunks": False},
+        )
+        .sort("number", DESCENDING)
+    ]
+
+
+async def load_revision(engine: AIOEngine, file_id: ObjectId, number: int) -> Optional[str]:
+    """Rebuild revision `number` from its nearest full snapshot and the deltas after it."""
+    chain = []
+    async for revision in (
+        engine.get_collection(FileRevision)
+        .find({"file_id": file_id, "number": {"$lte": number}})
+        .sort("number", DESCENDING)
+    ):
+        chain.append(revision)
+        if revision["kind"] == "full":
+            break
+
+    if not chain or chain[0]["number"] != number or chain[-1]["kind"] != "full":
+        return None
+
+    snapshot = chain.pop()
+    content = (
+        await load_blob(snapshot["file_url"], snapshot["chunks"], snapshot["codec"])
+    ).decode("utf-8")
+    for revision in reversed(chain):
+        content = apply_delta(content, revision["delta"])
+    return content
+
+
+async def delete_history(engine: AIOEngine, file_ids: list[ObjectId]) -> int:
+    result = await engine.get_collection(FileRevision).delete_many(
+        {"file_id": {"$in": file_ids}}
+    )
+    return result.deleted_count
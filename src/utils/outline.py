@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import ast
+import asyncio
+
+from typing import NamedTuple
+
+PYTHON_EXTENSIONS = ("py", "pyw", "pyi")
+
+
+class Symbol(NamedTuple):
+    name: str  # qualified, like ``Class.method``
+    kind: str  # "class", "def" or "method"
+    line: int  # 1-based
+
+
+def _walk(body: list[ast.stmt], prefix: str, in_class: bool) -> list[Symbol]:
+    symbols = []
+    for node in body:
+        if isinstance(node, ast.ClassDef):
+            symbols.append(Symbol(prefix + node.name, "class", node.lineno))
+            symbols += _walk(node.body, f"{prefix}{node.name}.", True)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append(Symbol(prefix + node.name, "method" if in_class else "def", node.lineno))
+            symbols += _walk(node.body, f"{prefix}{node.name}.", False)
+    return symbols
+
+
+def build_outline(source: str, filename: str = "<unknown>") -> list[Symbol]:
+    """Every class, function and method in `source`, in the order they are defined.
+
+    Raises `SyntaxError` if the source doesn't parse.
+    """
+    return _walk(ast.parse(source, filename).body, "", False)
+
+
+async def outline(source: str, filename: str = "<unknown>") -> list[Symbol]:
+    """Build the outline of `source` in a worker thread, see `build_outline`."""
+    return await asyncio.to_thread(build_outline, source, filename)
@@ -1,4 +1,8 @@
-from typing import Union
+import bisect
+import math
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Sequence, Union
 from abc import abstractmethod, ABC
 
 from disnake import (
@@ -11,6 +15,8 @@ from disnake import (
 from disnake.ui import View, Button, button
 from disnake.ext.commands import Context
 
+from .utils import escape_codeblock
+
 
 class LineTooLong(Exception):
     ...
@@ -20,10 +26,122 @@ class PageTooLong(Exception):
     ...
 
 
+EMBED_LIMIT = 4096
+PAGE_CACHE_SIZE = 8
+
+
+def _truncate(line: str, width: int) -> str:
+    """Cut `line` short, marked with an ellipsis, so it is at most `width` characters escaped."""
+    if len(line) + 2 * line.count("```") <= width:
+        return line
+    piece = line[: width - 1]
+    # don't leave part of a fence behind, it would be left unescaped
+    piece = piece[: width - 1 - 2 * piece.count("```")].rstrip("`")
+    return piece + "…"
+
+
+class PageIndex:
+    """Packs lines into pages as full as the embed character budget allows.
+
+    Lines are added to a page greedily until the next one would push the page,
+    counting its code block escaping and `overhead` (prefix, suffix, footer...),
+    past `budget`, or until the page holds `max_lines`. A line that can't fit on a
+    page by itself is split over as many pages as it needs. Only the first line of
+    every page is stored, so the lines of page N are a slice found in O(1) and
+    the page holding a line is a binary search.
+
+    Parameters
+    ----------
+        lines: Sequence[:class:`str`]
+            The lines to pack, each already carrying its own newline and gutter.
+
+        budget: :class:`int`
+            The most characters a rendered page may have. Defaults to 4096.
+
+        overhead: :class:`int`
+            The characters every page needs besides its lines.
+
+        max_lines: Optional[:class:`int`]
+            The most lines a page may hold, if any.
+    """
+
+    def __init__(
+        self,
+        lines: Sequence[str],
+        *,
+        budget: int = EMBED_LIMIT,
+        overhead: int = 0,
+        max_lines: Optional[int] = None,
+    ):
+        self.lines = lines
+        self.starts = [0]  # index in `self.lines` of the first line of every page
+        # once a line is split, `self.lines` becomes a list of the pieces and this
+        # maps every piece back to the index of the line it came from
+        self._origins: Optional[list[int]] = None
+        room = budget - overhead
+        if room <= 0:
+            raise PageTooLong(f"Expected the page overhead to be less than {budget} characters")
+
+        size = count = 0
+        for index, line in enumerate(lines):
+            # escaping turns every ``` into 5 characters
+            length = len(line) + 2 * line.count("```")
+            if length > room and self._origins is None:
+                self.lines = list(lines[:index])
+                self._origins = list(range(index))
+            pieces = self._split(line, room) if length > room else [line]
+
+            for piece in pieces:
+                if self._origins is not None:
+                    self.lines.append(piece)
+                    self._origins.append(index)
+                    length = len(piece) + 2 * piece.count("```")
+                if count and (size + length > room or (max_lines and count >= max_lines)):
+                    self.starts.append(len(self.lines) - 1 if self._origins is not None else index)
+                    size = count = 0
+                size += length
+                count += 1
+
+    @staticmethod
+    def _split(line: str, room: int) -> list[str]:
+        pieces = []
+        while line:
+            piece = line[:room]
+            piece = piece[: room - 2 * piece.count("```")]
+            if len(piece) < len(line):
+                # a fence cut in two would be left unescaped at the end of a page
+                piece = piece.rstrip("`") or piece
+            pieces.append(piece)
+            line = line[len(piece):]
+        return pieces
+
+    @property
+    def page_count(self) -> int:
+        return len(self.starts)
+
+    def bounds(self, page_number: int) -> tuple[int, int]:
+        """The slice of `lines` that makes up the page."""
+        end = self.starts[page_number + 1] if page_number + 1 < len(self.starts) else len(self.lines)
+        return self.starts[page_number], end
+
+    def page(self, page_number: int) -> Sequence[str]:
+        start, end = self.bounds(page_number)
+        return self.lines[start:end]
+
+    def page_of(self, line_index: int) -> int:
+        """The page holding (the start of) the line at `line_index` of the original lines."""
+        if self._origins is not None:
+            line_index = bisect.bisect_left(self._origins, line_index)
+        return bisect.bisect_right(self.starts, line_index) - 1
+
+
 class _AbstractPaginator(View, ABC):
     """The abstract class that every paginator should inherit from.
     In order to use this paginator, you need to subclass this object and override the `get_pages` method
     with your own that adds pages to ``self.pages``.
+    Paginators with many pages can instead only index their source in `get_pages`, and override
+    `page_count` and `_render_page` to build a page when it is shown; the last `PAGE_CACHE_SIZE`
+    shown pages are cached.
 
     NOTE: Never ``.start`` the paginator if you haven't subclassed it and overridden the `get_pages` method.
 
@@ -69,13 +187,32 @@ class _AbstractPaginator(View, ABC):
 
         self.current_page = 0
         self.pages = []
+        self._page_cache: OrderedDict[int, str] = OrderedDict()
 
     @abstractmethod
     def get_pages(self):
         pass
 
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    async def _render_page(self, page_number: int) -> str:
+        return self.pages[page_number]
+
+    async def get_page(self, page_number: int) -> str:
+        if page_number in self._page_cache:
+            self._page_cache.move_to_end(page_number)
+            return self._page_cache[page_number]
+
+        page = await self._render_page(page_number)
+        self._page_cache[page_number] = page
+        if len(self._page_cache) > PAGE_CACHE_SIZE:
+            self._page_cache.popitem(last=False)
+        return page
+
     def _update_labels(self):
-        if len(self.pages) == 1:
+        if self.page_count == 1:
             self.clear_items()
             self.add_item(self.exit)
             return
@@ -85,21 +222,15 @@ class _AbstractPaginator(View, ABC):
         else:
             self.first_page.disabled = self.previous_page.disabled = False
 
-        if self.current_page == len(self.pages) - 1:
+        if self.current_page == self.page_count - 1:
             self.last_page.disabled = self.next_page.disabled = True
         else:
             self.last_page.disabled = self.next_page.disabled = False
 
-    async def _show_page(self, page_number: int) -> None:
-        if page_number < 0:
-            return
-        elif page_number >= len(self.pages):
-            return
-
-        self.current_page = page_number
-        em = Embed(description=self.pages[self.current_page])
+    async def _make_embed(self) -> Embed:
+        em = Embed(description=await self.get_page(self.current_page))
 
-        page_footer = f"Page {self.current_page + 1}/{len(self.pages)}"
+        page_footer = f"Page {self.current_page + 1}/{self.page_count}"
         footer_kwargs = {"text": page_footer}
         if self.embed_footer_kwargs:
             footer_text = self.embed_footer_kwargs.get("text")
@@ -113,26 +244,22 @@ class _AbstractPaginator(View, ABC):
 
         if self.embed_author_kwargs:
             em.set_author(**self.embed_author_kwargs)
+        return em
+
+    async def _show_page(self, page_number: int) -> None:
+        if page_number < 0:
+            return
+        elif page_number >= self.page_count:
+            return
+
+        self.current_page = page_number
+        em = await self._make_embed()
         self._update_labels()
         await self.message.edit(embed=em, view=self)
 
     async def start(self):
         self.get_pages()
-        em = Embed(description=self.pages[self.current_page])
-        page_footer = f"Page {self.current_page + 1}/{len(self.pages)}"
-        footer_kwargs = {"text": page_footer}
-        if self.embed_footer_kwargs:
-            footer_text = self.embed_footer_kwargs.get("text")
-            icon_url = self.embed_footer_kwargs.get("icon_url")
-            if footer_text is not None:
-                page_footer = footer_text + " • " + page_footer
-                footer_kwargs["text"] = page_footer
-            if icon_url is not None:
-                footer_kwargs["icon_url"] = icon_url
-        em.set_footer(**footer_kwargs)
-
-        if self.embed_author_kwargs:
-            em.set_author(**self.embed_author_kwargs)
+        em = await self._make_embed()
 
         self._update_labels()
         if self.message is None:
@@ -173,7 +300,7 @@ class _AbstractPaginator(View, ABC):
     async def last_page(self, button: Button, inter: MessageInteraction):
         """Goes to the last page."""
         await inter.response.defer()
-        await self._show_page(len(self.pages) - 1)
+        await self._show_page(self.page_count - 1)
 
     @button(label="Exit", style=ButtonStyle.red)
     async def exit(self, button: Button, inter: MessageInteraction):
@@ -249,18 +376,31 @@ class TextPaginator(_AbstractPaginator):
         self.suffix = suffix
 
     def get_pages(self):
-        text = self.text
-        while True:
-            if len(text) != 0:
-                new_text = text[0: self.breakpoint]
-                if self.prefix:
-                    new_text = self.prefix + "\n" + new_text
-                if self.suffix:
-                    new_text = new_text + "\n" + self.suffix
-                text = text[self.breakpoint:]
-                self.pages.append(new_text)
-            else:
-                break
+        # Only the offset of every page is computed up front; a page prefers to end
+        # on a line break so lines aren't cut in half.
+        self.offsets = [0]
+        while len(self.text) - self.offsets[-1] > self.breakpoint:
+            start = self.offsets[-1]
+            end = self.text.rfind("\n", start + 1, start + self.breakpoint)
+            self.offsets.append(end + 1 if end != -1 else start + self.breakpoint)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.offsets)
+
+    async def _render_page(self, page_number: int) -> str:
+        start = self.offsets[page_number]
+        end = (
+            self.offsets[page_number + 1]
+            if page_number + 1 < len(self.offsets)
+            else len(self.text)
+        )
+        page = escape_codeblock(self.text[start:end].removesuffix("\n"))
+        if self.prefix:
+            page = self.prefix + "\n" + page
+        if self.suffix:
+            page = page + "\n" + self.suffix
+        return page
 
 
 class LinePaginator(_AbstractPaginator):
@@ -274,8 +414,9 @@ class LinePaginator(_AbstractPaginator):
         lines: :class:`list`
             The list of lines to paginate over.
 
-        line_limit: :class:`int`
+        line_limit: Optional[:class:`int`]
             The limit of how many lines should be displayed per page. Defaults to 10.
+            Pages are also cut short to fit the embed, so ``None`` packs every page as full as it can be.
 
         prefix: :class:`str`
             The prefix that appears at the start of every page.
@@ -308,7 +449,7 @@ class LinePaginator(_AbstractPaginator):
         ctx: Union[Context, MessageInteraction, ApplicationCommandInteraction],
         lines: list[str],
         *,
-        line_limit: int = 10,
+        line_limit: Optional[int] = 10,
         prefix: str = "",
         suffix: str = "",
         message: Message = None,
@@ -329,7 +470,7 @@ class LinePaginator(_AbstractPaginator):
         self.suffix = suffix
 
     def _lines_to_page(self, lines: list[str]):
-        page = "".join(lines)
+        page = escape_codeblock("".join(lines))
         if self.prefix:
             page = self.prefix + "\n" + page
         if self.suffix:
@@ -338,33 +479,105 @@ class LinePaginator(_AbstractPaginator):
         return page
 
     def get_pages(self):
-        lines = []
-        line_index = 0
-        page_index = 0
-        for line in self.lines:
-            if len(line) > 4096:
-                raise LineTooLong(
-                    f"Expected the line at index {line_index} to be less than 4096 characters"
-                )
-
-            lines.append(line)
-            if len(lines) >= self.line_limit:
-                page = self._lines_to_page(lines)
-                if len(page) > 4096:
-                    raise PageTooLong(
-                        f"Page at index {page_index} has to be less than 4096 characters. "
-                        "Please lessen the 'line_limit'"
-                    )
-                page_index += 1
-                self.pages.append(page)
-                lines = []
-            line_index += 1
-        else:
-            if lines:
-                page = self._lines_to_page(lines)
-                if len(page) > 4096:
-                    raise PageTooLong(
-                        f"Page at index {page_index} has to be less than 4096 characters. "
-                        "Please lessen the 'line_limit'"
-                    )
-                self.pages.append(page)
+        self.index = PageIndex(
+            self.lines,
+            overhead=len(self._lines_to_page([])),
+            max_lines=self.line_limit,
+        )
+
+    @property
+    def page_count(self) -> int:
+        return self.index.page_count
+
+    async def _render_page(self, page_number: int) -> str:
+        return self._lines_to_page(self.index.page(page_number))
+
+
+class CursorPaginator(LinePaginator):
+    """A line paginator whose lines are fetched one page at a time, such as from a database cursor.
+
+    Parameters
+    ----------
+        ctx: Union[:class:`.Context`, :class:`.MessageInteraction`, :class:`.ApplicationCommandInteraction`]
+            The context/interaction object to use for this paginator.
+
+        fetch: Callable[[:class:`int`, :class:`int`], Awaitable[:class:`list`]]
+            A coroutine function taking ``skip`` and ``limit`` that returns the lines of one page.
+
+        total: :class:`int`
+            The total number of lines that ``fetch`` can return.
+
+        line_limit: :class:`int`
+            The limit of how many lines should be displayed per page. Defaults to 10.
+            If a page would not fit in an embed, its longest lines are cut short.
+
+        prefix: :class:`str`
+            The prefix that appears at the start of every page.
+
+        suffix: :class:`str`
+            The suffix that appears at the end of every page.
+
+        message: :class:`.Message`
+            The message object to use instead of sending another message.
+
+        embed_footer_kwargs: :class:`dict`
+            A dict containing the kwargs for the ``.set_footer`` embed method.
+
+        embed_author_kwargs: :class:`dict`
+            A dict containing the kwargs for the ``.set_author`` embed method.
+
+        timeout: :class:`float`
+            The time for how long the paginator is supposed to wait for an interaction until it times out.
+
+    Methods
+    -------
+        `start`
+            |coro|
+
+            Starts the paginator.
+    """
+
+    def __init__(
+        self,
+        ctx: Union[Context, MessageInteraction, ApplicationCommandInteraction],
+        fetch: Callable[[int, int], Awaitable[list[str]]],
+        total: int,
+        *,
+        line_limit: int = 10,
+        prefix: str = "",
+        suffix: str = "",
+        message: Message = None,
+        embed_footer_kwargs: dict[str, str] = None,
+        embed_author_kwargs: dict[str, str] = None,
+        timeout: float = 180.0,
+    ):
+        super().__init__(
+            ctx,
+            [],
+            line_limit=line_limit,
+            prefix=prefix,
+            suffix=suffix,
+            message=message,
+            embed_footer_kwargs=embed_footer_kwargs,
+            embed_author_kwargs=embed_author_kwargs,
+            timeout=timeout,
+        )
+        self.fetch = fetch
+        self.total = total
+
+    def get_pages(self):
+        pass
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(self.total / self.line_limit))
+
+    async def _render_page(self, page_number: int) -> str:
+        lines = await self.fetch(page_number * self.line_limit, self.line_limit)
+        page = self._lines_to_page(lines)
+        if len(page) > EMBED_LIMIT:
+            # the page count is fixed before any page is fetched, so instead of
+            # moving lines to another page, every line gets an equal share
+            room = EMBED_LIMIT - len(self._lines_to_page([]))
+            page = self._lines_to_page([_truncate(line, room // len(lines)) for line in lines])
+        return page
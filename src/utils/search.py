@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import re
+import zlib
+
+from bson import ObjectId
+from odmantic import AIOEngine, Model
+from pymongo import ASCENDING, IndexModel, ReplaceOne
+
+from .blobs import IntegrityError, load_blob
+from .fetch import FetchError
+
+TOKEN = re.compile(r"[A-Za-z_][A-Za-z0-9_]{1,63}")
+MAX_LINES_PER_TOKEN = 50  # the hits kept for each token of a file
+# keeps a file's FileTokens document well under MongoDB's 16 MB document limit:
+# at most 64 characters and 50 line numbers per token is under 1 KB each
+MAX_TOKENS_PER_FILE = 5000
+MAX_QUERY_TOKENS = 8
+BACKFILL_BATCH = 100
+
+
+class FileTokens(Model):  # noqa
+    """The tokens of one saved file, and the lines they appear on.
+
+    Indexing `tokens` builds a multikey index, which is the inverted index: one
+    lookup finds every file of a user containing a token.
+    """
+
+    file_id: ObjectId
+    user_id: int
+    tokens: list[str]
+    lines: dict[str, list[int]]  # 1-based line numbers, at most `MAX_LINES_PER_TOKEN`
+    counts: dict[str, int]
+
+
+SEARCH_INDEXES = [
+    IndexModel([("file_id", ASCENDING)], name="file_id", unique=True),
+    IndexModel([("user_id", ASCENDING), ("tokens", ASCENDING)], name="user_tokens"),
+]
+
+
+async def ensure_search_indexes(engine: AIOEngine) -> list[str]:
+    return await engine.get_collection(FileTokens).create_indexes(SEARCH_INDEXES)
+
+
+async def backfill_search(engine: AIOEngine) -> int:
+    """Index the saved files that have no tokens yet, like those saved before search.
+
+    The unindexed files are found with one join against the index, and are then
+    downloaded one at a time. Files that can't be downloaded or decoded are left
+    for the next pass. Returns the number of files indexed.
+    """
+    from .storage import FileModel  # storage imports this module
+
+    tokens = engine.get_collection(FileTokens)
+    postings: dict[int, dict[ObjectId, dict]] = {}
+    pending = indexed = 0
+    async for document in engine.get_collection(FileModel).aggregate(
+        [
+            {"$match": {"file_url": {"$ne": None}}},
+            {
+                "$lookup": {
+                    "from": tokens.name,
+                    "localField": "_id",
+                    "foreignField": "file_id",
+                    "as": "indexed",
+                }
+            },
+            {"$match": {"indexed": []}},
+            {"$project": {"user_id": True, "file_url": True, "chunks": True, "codec": True}},
+        ]
+    ):
+        try:
+            data = await load_blob(document["file_url"], document.get("chunks"), document.get("codec"))
+            content = bytes(data).decode("utf-8")
+        except (FetchError, IntegrityError, zlib.error, ValueError):
+            continue
+
+        postings.setdefault(document["user_id"], {})[document["_id"]] = await asyncio.to_thread(
+            build_postings, content
+        )
+        pending += 1
+        if pending >= BACKFILL_BATCH:
+            for user_id, documents in postings.items():
+                await index_postings(engine, user_id, documents)
+            indexed += pending
+            postings, pending = {}, 0
+
+    for user_id, documents in postings.items():
+        await index_postings(engine, user_id, documents)
+    return indexed + pending
+
+
+def tokenize(query: str) -> list[str]:
+    return list(dict.fromkeys(token.lower() for token in TOKEN.findall(query)))
+
+
+def build_postings(content: str) -> dict:
+    lines: dict[str, list[int]] = {}
+    counts: dict[str, int] = {}
+    for number, line in enumerate(content.splitlines(), 1):
+        for token in TOKEN.findall(line):
+            token = token.lower()
+            counts[token] = counts.get(token, 0) + 1
+            hits = lines.setdefault(token, [])
+            if len(hits) < MAX_LINES_PER_TOKEN and (not hits or hits[-1] != number):
+                hits.append(number)
+    if len(counts) > MAX_TOKENS_PER_FILE:
+        # the most frequent tokens are kept, the rest of the file isn't searchable
+        kept = sorted(counts, key=counts.__getitem__, reverse=True)[:MAX_TOKENS_PER_FILE]
+        lines = {token: lines[token] for token in kept}
+        counts = {token: counts[token] for token in kept}
+    return {"tokens": list(lines), "lines": lines, "counts": counts}
+
+
+async def index_postings(
+    engine: AIOEngine, user_id: int, postings: dict[ObjectId, dict]
+) -> None:
+    """Replace the indexed tokens of many files with already built postings."""
+    if postings:
+        await engine.get_collection(FileTokens).bulk_write(
+            [
+                ReplaceOne(
+                    {"file_id": file_id},
+                    {"file_id": file_id, "user_id": user_id, **document},
+                    upsert=True,
+                )
+                for file_id, document in postings.items()
+            ],
+            ordered=False,
+        )
+
+
+async def index_file(engine: AIOEngine, *, file_id: ObjectId, user_id: int, content: str) -> None:
+    """Replace the indexed tokens of one file; called whenever its content is saved."""
+    postings = await asyncio.to_thread(build_postings, content)
+    await index_postings(engine, user_id, {file_id: postings})
+
+
+async def delete_tokens(engine: AIOEngine, file_ids: list[ObjectId]) -> int:
+    result = await engine.get_collection(FileTokens).delete_many(
+        {"file_id": {"$in": file_ids}}
+    )
+    return result.deleted_count
+
+
+async def search(engine: AIOEngine, user_id: int, query: str, limit: int = 50) -> list[dict]:
+    """Find the user's files containing the tokens in `query`, best matches first.
+
+    Files are ranked by a tf-idf score, so a match on a rare token outweighs many
+    matches on a common one. Only the index is read, never the files themselves.
+    Returns ``{"file_id", "score", "lines"}`` where `lines` are the matching line
+    numbers, those matching the most tokens first.
+    """
+    tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return []
+
+    collection = engine.get_collection(FileTokens)
+    total = await collection.count_documents({"user_id": user_id})
+    frequencies = {
+        token: await collection.count_documents({"user_id": user_id, "tokens": token})
+        for token in tokens
+    }
+
+    projection = {"file_id": True}
+    for token in tokens:
+        projection[f"lines.{token}"] = True
+        projection[f"counts.{token}"] = True
+
+    results = []
+    async for document in collection.find(
+        {"user_id": user_id, "tokens": {"$in": tokens}}, projection=projection
+    ):
+        score = sum(
+            (1 + math.log(count)) * math.log(1 + total / frequencies[token])
+            for token, count in document.get("counts", {}).items()
+        )
+        matched: dict[int, int] = {}
+        for hits in document.get("lines", {}).values():
+            for number in hits:
+                matched[number] = matched.get(number, 0) + 1
+        results.append(
+            {
+                "file_id": document["file_id"],
+                "score": score,
+                "lines": sorted(matched, key=lambda number: (-matched[number], number)),
+            }
+        )
+
+    results.sort(key=lambda result: result["score"], reverse=True)
+    return results[:limit]
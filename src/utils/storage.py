@@ -0,0 +1,592 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from collections import OrderedDict
+from bson import ObjectId
+from odmantic import AIOEngine, Model
+from pymongo import ASCENDING, DeleteMany, IndexModel, ReturnDocument, UpdateOne
+from typing import Awaitable, Callable, Optional
+
+from .blobs import delete_blob
+from .history import FileRevision, delete_history
+from .search import delete_tokens
+
+
+class FileModel(Model):  # noqa
+    user_id: int
+    name: str
+    file_url: Optional[str] = None
+    folder: Optional[str] = None
+    create_epoch: float
+    last_edit_epoch: Optional[float] = None
+    ancestors: list[str] = []
+    size: Optional[int] = None
+    line_count: Optional[int] = None
+    content_hash: Optional[str] = None
+    file_type: Optional[str] = None
+    last_opened_epoch: Optional[float] = None
+    chunks: Optional[list[dict]] = None
+    codec: Optional[str] = None
+    stored_size: Optional[int] = None
+
+
+# Every saved-files lookup filters on `user_id`, then `folder`, then `name`, so one
+# compound index also serves the (user_id) and (user_id, folder) prefixes. It is
+# unique so that a path can only ever point at one document.
+FILE_INDEXES = [
+    IndexModel(
+        [("user_id", ASCENDING), ("folder", ASCENDING), ("name", ASCENDING)],
+        name="user_folder_name",
+        unique=True,
+    ),
+    # `ancestors` is the materialized path of every folder above a document, so a
+    # whole subtree is a single multikey index lookup.
+    IndexModel([("user_id", ASCENDING), ("ancestors", ASCENDING)], name="user_ancestors"),
+    # copies of a file share its blob, see `release_blob`
+    IndexModel([("file_url", ASCENDING)], name="file_url"),
+]
+
+
+def ancestors_of(folder: Optional[str]) -> list[str]:
+    """Return every folder path from the root down to `folder`.
+
+    ``"/a/b/"`` gives ``["/", "/a/", "/a/b/"]``.
+    """
+    parts = [part for part in (folder or "/").split("/") if part]
+    return ["/"] + ["/" + "/".join(parts[: i + 1]) + "/" for i in range(len(parts))]
+
+
+def folder_path(parent: str, folder_name: str) -> str:
+    return f"{parent}{folder_name}/"
+
+
+def subtree_query(user_id: int, path: str) -> dict:
+    """Match every document below the folder at `path`, at any depth."""
+    return {"user_id": user_id, "ancestors": path}
+
+
+def list_subtree(engine: AIOEngine, user_id: int, path: str, projection: dict = None):
+    return engine.get_collection(FileModel).find(
+        subtree_query(user_id, path), projection=projection
+    )
+
+
+async def migrate_paths(engine: AIOEngine) -> int:
+    """Fill in `ancestors` for documents saved before the path model existed."""
+    collection = engine.get_collection(FileModel)
+    requests = []
+    migrated = 0
+    async for document in collection.find(
+        {"ancestors": {"$exists": False}}, projection={"folder": True}
+    ):
+        folder = document.get("folder") or "/"
+        requests.append(
+            UpdateOne(
+                {"_id": document["_id"]},
+                {"$set": {"folder": folder, "ancestors": ancestors_of(folder)}},
+            )
+        )
+        migrated += 1
+        if len(requests) >= 1000:
+            await collection.bulk_write(requests, ordered=False)
+            requests = []
+
+    if requests:
+        await collection.bulk_write(requests, ordered=False)
+    return migrated
+
+
+async def compact_duplicates(engine: AIOEngine) -> int:
+    """Merge documents that share a (user_id, folder, name) path.
+
+    The most recently written document is kept and inherits the earliest
+    `create_epoch`; the rest are deleted. Returns the number of deleted documents.
+    """
+    collection = engine.get_collection(FileModel)
+    requests = []
+    removed = 0
+    async for group in collection.aggregate(
+        [
+            {"$sort": {"last_edit_epoch": -1, "create_epoch": -1}},
+            {
+                "$group": {
+                    "_id": {"user_id": "$user_id", "folder": "$folder", "name": "$name"},
+                    "ids": {"$push": "$_id"},
+                    "create_epoch": {"$min": "$create_epoch"},
+                    "count": {"$sum": 1},
+                }
+            },
+            {"$match": {"count": {"$gt": 1}}},
+        ],
+        allowDiskUse=True,
+    ):
+        keep, *duplicates = group["ids"]
+        requests.append(
+            UpdateOne({"_id": keep}, {"$set": {"create_epoch": group["create_epoch"]}})
+        )
+        requests.append(DeleteMany({"_id": {"$in": duplicates}}))
+        removed += len(duplicates)
+        if len(requests) >= 1000:
+            await collection.bulk_write(requests, ordered=False)
+            requests = []
+
+    if requests:
+        await collection.bulk_write(requests, ordered=False)
+    return removed
+
+
+async def ensure_indexes(engine: AIOEngine) -> list[str]:
+    collection = engine.get_collection(FileModel)
+    # Migrated first: it turns a missing folder into "/", which can collide with
+    # documents already saved at "/" and has to be compacted along with them.
+    await migrate_paths(engine)
+    existing = await collection.index_information()
+    current = existing.get("user_folder_name")
+    if current is None or not current.get("unique", False):
+        # The unique index can only be built once the duplicates left behind by
+        # the old insert-only saves are gone, so the compaction runs exactly once.
+        if current is not None:
+            await collection.drop_index("user_folder_name")
+        await compact_duplicates(engine)
+
+    return await collection.create_indexes(FILE_INDEXES)
+
+
+async def save_file(
+    engine: AIOEngine, *, user_id: int, folder: str, name: str, **fields
+) -> tuple[bool, ObjectId]:
+    """Insert or overwrite the file at `folder`/`name` in a single round-trip.
+
+    Returns whether an existing file was overwritten, and the file's id.
+    """
+    now = time.time()
+    document = await engine.get_collection(FileModel).find_one_and_update(
+        {"user_id": user_id, "folder": folder, "name": name},
+        {
+            "$set": {**fields, "ancestors": ancestors_of(folder), "last_edit_epoch": now},
+            "$setOnInsert": {"create_epoch": now},
+        },
+        projection={"_id": True, "create_epoch": True},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    # `create_epoch` is only `now` when this call inserted the document
+    return document["create_epoch"] != now, document["_id"]
+
+
+async def delete_path(engine: AIOEngine, user_id: int, folder: str, name: str) -> bool:
+    document = await engine.get_collection(FileModel).find_one_and_delete(
+        {"user_id": user_id, "folder": folder, "name": name}, projection={"_id": True}
+    )
+    if document is None:
+        return False
+
+    await delete_history(engine, [document["_id"]])
+    await delete_tokens(engine, [document["_id"]])
+    return True
+
+
+async def release_blob(bot, engine: AIOEngine, manifest: Optional[list[dict]]) -> bool:
+    """Delete a stored blob once no saved file and no full revision points at it.
+
+    Called with the blob a save replaced, so only the blobs that history still
+    needs are kept. Returns whether the blob was deleted.
+    """
+    if not manifest:
+        return False
+    url = manifest[0]["url"]
+    for model in (FileModel, FileRevision):
+        if await engine.get_collection(model).find_one({"file_url": url}, projection={"_id": True}):
+            return False
+    return await delete_blob(bot, manifest) > 0
+
+
+# Only what browsing, opening and prefetching a file read is kept in the tree.
+TREE_FIELDS = (
+    "folder",
+    "name",
+    "file_url",
+    "size",
+    "line_count",
+    "content_hash",
+    "file_type",
+    "last_opened_epoch",
+    "chunks",
+    "codec",
+    "stored_size",
+)
+
+
+class FileTreeCache:
+    """Keeps each browsing user's directory tree, with each file's metadata, in memory.
+
+    A tree is loaded with one query the first time a user browses, every write to the
+    saved-files collection is mirrored into it, and it is dropped once the user has
+    been idle for `ttl` seconds. Sorted listings are kept with the tree until a path
+    is added or removed.
+    """
+
+    def __init__(self, engine: AIOEngine, ttl: float = 600.0) -> None:
+        self.engine = engine
+        self.ttl = ttl
+        self._trees: dict[int, dict[str, dict[str, dict]]] = {}
+        self._last_used: dict[int, float] = {}
+        self._listings: dict[int, dict[Optional[str], list[tuple[str, str]]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, user_id: int) -> dict[str, dict[str, dict]]:
+        """Return the user's tree as ``{folder: {name: document}}``."""
+        self._last_used[user_id] = time.monotonic()
+        if user_id in self._trees:
+            self.hits += 1
+            return self._trees[user_id]
+
+        self.misses += 1
+        tree = {}
+        async for document in self.engine.get_collection(FileModel).find(
+            {"user_id": user_id},
+            projection=dict.fromkeys(TREE_FIELDS, True),
+        ):
+            tree.setdefault(document["folder"], {})[document["name"]] = document
+        self._trees[user_id] = tree
+        return tree
+
+    def loaded(self, user_id: int) -> bool:
+        """Whether the user's tree is in memory, so reading it costs no query."""
+        return user_id in self._trees
+
+    async def find(self, user_id: int, folder: str, name: str) -> Optional[dict]:
+        return (await self.get(user_id)).get(folder, {}).get(name)
+
+    async def listing(self, user_id: int, folder: Optional[str] = None) -> list[tuple[str, str]]:
+        tree = await self.get(user_id)
+        listings = self._listings.setdefault(user_id, {})
+        if folder not in listings:
+            folders = sorted(tree) if folder is None else [folder]
+            listings[folder] = [
+                (parent, name)
+                for parent in folders
+                for name in sorted(tree.get(parent, {}))
+            ]
+        return listings[folder]
+
+    async def paths(self, user_id: int) -> dict[ObjectId, str]:
+        """Map the id of every saved file of the user to its full path."""
+        return {
+            document["_id"]: parent + name
+            for parent, folder in (await self.get(user_id)).items()
+            for name, document in folder.items()
+            if "_id" in document
+        }
+
+    async def recent(self, user_id: int, limit: int) -> list[dict]:
+        """The user's most recently opened files, newest first."""
+        files = [
+            document
+            for folder in (await self.get(user_id)).values()
+            for document in folder.values()
+            if document.get("file_url") and document.get("last_opened_epoch")
+        ]
+        files.sort(key=lambda document: document["last_opened_epoch"], reverse=True)
+        return files[:limit]
+
+    def put(self, user_id: int, document: dict) -> None:
+        if user_id in self._trees:
+            folder = self._trees[user_id].setdefault(document["folder"], {})
+            if document["name"] not in folder:
+                self._listings.pop(user_id, None)
+            folder[document["name"]] = {**folder.get(document["name"], {}), **document}
+
+    def remove(self, user_id: int, folder: str, name: str) -> None:
+        if user_id in self._trees:
+            if self._trees[user_id].get(folder, {}).pop(name, None) is not None:
+                self._listings.pop(user_id, None)
+
+    def invalidate(self, user_id: int) -> None:
+        self._trees.pop(user_id, None)
+        self._last_used.pop(user_id, None)
+        self._listings.pop(user_id, None)
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.ttl
+        idle = [user_id for user_id, used in self._last_used.items() if used < cutoff]
+        for user_id in idle:
+            self.invalidate(user_id)
+        self.evictions += len(idle)
+        return len(idle)
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._trees),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _ignore_error(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+class ContentCache:
+    """A byte-budgeted LRU cache of downloaded file contents, keyed by file url.
+
+    Concurrent requests for the same url share one download.
+    """
+
+    def __init__(self, budget: int = 32 * 1024 * 1024) -> None:
+        self.budget = budget
+        self.size = 0
+        self._contents: OrderedDict[str, bytes] = OrderedDict()
+        self._pending: dict[str, asyncio.Task] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        if key in self._contents:
+            self._contents.move_to_end(key)
+            return self._contents[key]
+        return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.budget:
+            return
+        if key in self._contents:
+            self.size -= len(self._contents.pop(key))
+        self._contents[key] = data
+        self.size += len(data)
+        while self.size > self.budget:
+            _, evicted = self._contents.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _start(self, key: str, loader: Callable[[], Awaitable[bytes]]) -> asyncio.Task:
+        async def load() -> bytes:
+            try:
+                data = await loader()
+                self.put(key, data)
+                return data
+            finally:
+                self._pending.pop(key, None)
+
+        task = self._pending[key] = asyncio.ensure_future(load())
+        # a failed prefetch may never be awaited; retrieving the error here keeps
+        # asyncio from logging it, and a later fetch simply retries the download
+        task.add_done_callback(_ignore_error)
+        return task
+
+    async def fetch(self, key: str, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = self.get(key)
+        if data is not None:
+            return data
+        task = self._pending.get(key) or self._start(key, loader)
+        return await asyncio.shield(task)
+
+    def prefetch(self, key: str, loader: Callable[[], Awaitable[bytes]]) -> Optional[asyncio.Task]:
+        """Start downloading `key` in the background unless it is cached or already loading."""
+        if key in self._contents or key in self._pending:
+            return None
+        return self._start(key, loader)
+
+
+async def touch_file(engine: AIOEngine, user_id: int, folder: str, name: str) -> float:
+    now = time.time()
+    await engine.get_collection(FileModel).update_one(
+        {"user_id": user_id, "folder": folder, "name": name},
+        {"$set": {"last_opened_epoch": now}},
+    )
+    return now
+
+
+async def delete_folder(engine: AIOEngine, user_id: int, parent: str, name: str) -> int:
+    """Delete the folder `name` in `parent` and everything below it.
+
+    Returns the number of deleted documents, the folder itself included.
+    """
+    collection = engine.get_collection(FileModel)
+    query = subtree_query(user_id, folder_path(parent, name))
+    file_ids = [
+        document["_id"] async for document in collection.find(query, projection={"_id": True})
+    ]
+    await delete_history(engine, file_ids)
+    await delete_tokens(engine, file_ids)
+    contents = await collection.delete_many(query)
+    folder = await collection.delete_one(
+        {"user_id": user_id, "folder": parent, "name": "folder: " + name}
+    )
+    return contents.deleted_count + folder.deleted_count
+
+
+async def move_file(
+    engine: AIOEngine, user_id: int, parent: str, name: str, new_parent: str, new_name: str
+) -> int:
+    result = await engine.get_collection(FileModel).update_one(
+        {"user_id": user_id, "folder": parent, "name": name},
+        {
+            "$set": {
+                "folder": new_parent,
+                "name": new_name,
+                "ancestors": ancestors_of(new_parent),
+                "last_edit_epoch": time.time(),
+            }
+        },
+    )
+    return result.modified_count
+
+
+async def move_folder(
+    engine: AIOEngine, user_id: int, parent: str, name: str, new_parent: str, new_name: str
+) -> int:
+    """Move and/or rename the folder `name` in `parent`, along with its whole subtree.
+
+    The subtree is rewritten by a single pipeline update: the old folder path is
+    swapped for the new one at the start of every `folder` and `ancestors` entry.
+    Returns the number of moved documents, the folder itself included.
+    """
+    old_path = folder_path(parent, name)
+    new_path = folder_path(new_parent, new_name)
+    if new_path.startswith(old_path):
+        raise ValueError("A folder can't be moved inside itself")
+
+    def rebase(expression: str) -> dict:
+        return {
+            "$concat": [
+                new_path,
+                {"$substrCP": [expression, len(old_path), {"$strLenCP": expression}]},
+            ]
+        }
+
+    collection = engine.get_collection(FileModel)
+    contents = await collection.update_many(
+        subtree_query(user_id, old_path),
+        [
+            {
+                "$set": {
+                    "folder": rebase("$folder"),
+                    "ancestors": {
+                        "$concatArrays": [
+                            ancestors_of(new_parent),
+                            {
+                                "$map": {
+                                    "input": {
+                                        "$filter": {
+                                            "input": "$ancestors",
+                                            "cond": {
+                                                "$eq": [
+                                                    {"$substrCP": ["$$this", 0, len(old_path)]},
+                                                    old_path,
+                                                ]
+                                            },
+                                        }
+                                    },
+                                    "in": rebase("$$this"),
+                                }
+                            },
+                        ]
+                    },
+                }
+            }
+        ],
+    )
+    folder = await move_file(
+        engine, user_id, parent, "folder: " + name, new_parent, "folder: " + new_name
+    )
+    return contents.modified_count + folder
+
+
+def _listing_query(user_id: int, folder: Optional[str]) -> dict:
+    query = {"user_id": user_id}
+    if folder is not None:
+        query["folder"] = folder
+    return query
+
+
+async def count_paths(engine: AIOEngine, user_id: int, folder: Optional[str] = None) -> int:
+    return await engine.get_collection(FileModel).count_documents(
+        _listing_query(user_id, folder)
+    )
+
+
+async def list_paths(
+    engine: AIOEngine,
+    user_id: int,
+    folder: Optional[str] = None,
+    *,
+    skip: int = 0,
+    limit: int = 0,
+) -> list[tuple[str, str]]:
+    """List one page of ``(folder, name)`` pairs, sorted by path.
+
+    Only indexed fields are projected, so the index covers the whole query and no
+    document is loaded.
+    """
+    cursor = (
+        engine.get_collection(FileModel)
+        .find(
+            _listing_query(user_id, folder),
+            projection={"_id": False, "folder": True, "name": True},
+        )
+        .sort([("folder", ASCENDING), ("name", ASCENDING)])
+        .skip(skip)
+        .limit(limit)
+    )
+    return [(document["folder"], document["name"]) async for document in cursor]
+
+
+async def index_usage(engine: AIOEngine) -> dict[str, int]:
+    return {
+        stats["name"]: stats["accesses"]["ops"]
+        async for stats in engine.get_collection(FileModel).aggregate(
+            [{"$indexStats": {}}]
+        )
+    }
+
+
+def _stages(plan: dict) -> list[str]:
+    stages = [plan["stage"]]
+    if "inputStage" in plan:
+        stages += _stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _stages(child)
+    return stages
+
+
+async def explain_lookups(engine: AIOEngine, user_id: int) -> list[dict]:
+    """Explain every saved-files query shape and time it.
+
+    A shape is healthy when its winning plan is an index scan; a ``COLLSCAN``
+    means the lookup grows with the whole collection instead of the user's files.
+    """
+    collection = engine.get_collection(FileModel)
+    shapes = {
+        "all files": {"user_id": user_id},
+        "view folder": {"user_id": user_id, "folder": "/"},
+        "find by name": {"user_id": user_id, "folder": "/", "name": "main.py"},
+        "subtree": subtree_query(user_id, "/"),
+    }
+
+    results = []
+    for name, query in shapes.items():
+        start = time.perf_counter()
+        plan = await collection.find(query).explain()
+        elapsed = time.perf_counter() - start
+
+        stats = plan.get("executionStats", {})
+        winning = plan["queryPlanner"]["winningPlan"]
+        # the slot-based engine (MongoDB 5.0+) nests the classic plan one level down
+        stages = _stages(winning.get("queryPlan", winning))
+        results.append(
+            {
+                "query": name,
+                "stages": stages,
+                "indexed": "IXSCAN" in stages and "COLLSCAN" not in stages,
+                "keys_examined": stats.get("totalKeysExamined"),
+                "docs_examined": stats.get("totalDocsExamined"),
+                "ms": elapsed * 1000,
+            }
+        )
+    return results
@@ -2,11 +2,16 @@ from __future__ import annotations
 
 import aiohttp
 import disnake
+import hashlib
 import io
+import mimetypes
 import random
 
 from disnake.ext import commands
-from typing import TypeVar, Type
+from typing import Optional, TypeVar, Type
+
+from .blobs import load_blob, store_blob
+from .outline import Symbol, outline
 
 
 def add_lines(content: str) -> list[str]:
@@ -20,6 +25,14 @@ def add_lines(content: str) -> list[str]:
     return lines
 
 
+def escape_codeblock(text: str) -> str:
+    """Keep `text` from closing the code block it is rendered in.
+
+    Only applied to what is being displayed; stored content is never escaped.
+    """
+    return text.replace("```", "`\u200b`\u200b`")
+
+
 Self = TypeVar("Self")
 
 
@@ -31,10 +44,32 @@ class IncorrectInstance(Exception):
 
 
 class File:
-    def __init__(self, *, filename, content, bot) -> None:
+    def __init__(
+        self,
+        *,
+        filename,
+        content=None,
+        bot,
+        url=None,
+        chunks=None,
+        codec=None,
+        stored_size=None,
+        file_id=None,
+        metadata=None,
+    ) -> None:
         self.filename = filename
         self.bot = bot
-        self.content = content
+        self._content = content
+        self.url = url  # content is downloaded from here on the first `load`
+        self.chunks = chunks  # manifest of the stored chunks, see `upload_blob`
+        self.codec = codec
+        self.stored_size = stored_size
+        self.metadata = metadata or {}
+        self.file_id = file_id  # id of the saved FileModel, if any
+        self.saved_hash = self.metadata.get("content_hash")  # hash of the stored copy
+        self.saved_content = None  # the stored copy itself, once loaded
+        self.dirty = False  # set by every edit to `content`
+        self._symbols = None  # outline of the content, dropped by every edit
         self.undo = []  # passed in EditView
         self.redo = []  # this too
         self.setup()
@@ -43,14 +78,108 @@ class File:
     def setup(self) -> None:
         if hasattr(self.filename, "content"):
             self.filename = self.filename.content
-        if hasattr(self.content, "content"):
-            self.content = self.content.content
-        if hasattr(self.content, "decode"):
-            self.content = self.content.decode("utf-8")
-        self.content = self.content.replace("```", "`\u200b`\u200b`\u200b")
+        if self._content is not None:
+            self._content = self.clean(self._content)
+
+    @staticmethod
+    def clean(content) -> str:
+        if hasattr(content, "content"):
+            content = content.content
+        if hasattr(content, "decode"):
+            content = content.decode("utf-8")
+        return content
+
+    @property
+    def content(self) -> Optional[str]:
+        return self._content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self._content = value
+        self.dirty = True
+        self._symbols = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._content is not None
+
+    async def load(self) -> str:
+        if self._content is None:
+            self._content = self.clean(
+                await self.bot.file_contents.fetch(
+                    self.url, lambda: load_blob(self.url, self.chunks, self.codec)
+                )
+            )
+            self.saved_content = self._content
+            self.metadata = {}
+        return self._content
+
+    async def symbols(self) -> list[Symbol]:
+        """The classes, functions and methods of the file, if it is Python, see `outline`.
+
+        The outline is cached until the content is next edited.
+        """
+        if self._symbols is None:
+            self._symbols = await outline(await self.load(), self.filename)
+        return self._symbols
+
+    def changed(self) -> bool:
+        """Whether the content differs from the stored copy and has to be uploaded again."""
+        if self.saved_hash is None or self.url is None:
+            return True
+        if not self.loaded or not self.dirty:
+            return False
+        return self.describe()["content_hash"] != self.saved_hash
+
+    def mark_saved(self, stored: dict, content_hash: str) -> None:
+        self.url = stored["chunks"][0]["url"]
+        self.chunks = stored["chunks"]
+        self.codec = stored["codec"]
+        self.stored_size = stored["stored_size"]
+        self.saved_hash = content_hash
+        self.saved_content = self._content
+        self.dirty = False
+
+    async def store(self) -> dict:
+        """Compress and upload the content, see `store_blob`."""
+        content = await self.load()
+        stored = await store_blob(self.bot, self.filename, content.encode("utf-8"))
+        self.mark_saved(stored, self.describe()["content_hash"])
+        return stored
+
+    def storage_info(self) -> dict:
+        return {"chunks": self.chunks, "codec": self.codec, "stored_size": self.stored_size}
+
+    def describe(self) -> dict:
+        """Metadata stored next to the file so it can be shown without downloading it."""
+        if not self.loaded:
+            return self.metadata
+
+        return {
+            "size": self.size,
+            "line_count": self.line_count,
+            "content_hash": hashlib.sha256(self.content.encode("utf-8")).hexdigest(),
+            "file_type": self.content_type,
+        }
+
+    @property
+    def size(self) -> Optional[int]:
+        if not self.loaded:
+            return self.metadata.get("size")
+        return len(self.content.encode("utf-8"))
+
+    @property
+    def line_count(self) -> Optional[int]:
+        if not self.loaded:
+            return self.metadata.get("line_count")
+        return len(self.content.split("\n"))
+
+    @property
+    def content_type(self) -> str:
+        return self.metadata.get("file_type") or mimetypes.guess_type(self.filename)[0] or "text/plain"
 
     async def get_message(self) -> disnake.Message:
-        f = io.StringIO(self.content)
+        f = io.StringIO(await self.load())
 
         channel = random.choice(self.bot.send_guild.text_channels)
         message = await channel.send(file=disnake.File(fp=f, filename=self.filename))  # type: ignore
@@ -63,15 +192,26 @@ class File:
         bot: commands.Bot,
         url,
     ) -> Self:
+        file_ = cls(filename=url.split("?")[0].split("/")[-1], bot=bot, url=url)
+        await file_.load()
+        return file_
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                content = await response.read()
-                filename = url.split("?")[0].split("/")[-1]
+    @classmethod
+    def from_document(cls: Type[Self], *, bot: commands.Bot, document: dict) -> Self:
+        """A saved file that is only downloaded once its content is needed."""
         return cls(
-            filename=filename,
-            content=content,
+            filename=document["name"],
             bot=bot,
+            url=document["file_url"],
+            chunks=document.get("chunks"),
+            codec=document.get("codec"),
+            stored_size=document.get("stored_size"),
+            file_id=document.get("_id"),
+            metadata={
+                key: document[key]
+                for key in ("size", "line_count", "content_hash", "file_type")
+                if document.get(key) is not None
+            },
         )
 
     async def to_url(self) -> str:
@@ -89,7 +229,7 @@ class EmbedFactory:
         return (
             disnake.Embed(
                 title="Jarvide Text Editor",
-                description=f"```{format_}\n{description}```",
+                description=f"```{format_}\n{escape_codeblock(description)}```",
                 timestamp=ctx.message.created_at,
             )
             .set_author(name=ctx.author.name, icon_url=ctx.author.display_avatar.url)
@@ -109,7 +249,7 @@ class EmbedFactory:
         return (
             disnake.Embed(
                 title="Jarvide Text Editor",
-                description=f"**{path}**\n```{format_}\n{code}```{page_number}",
+                description=f"**{path}**\n```{format_}\n{escape_codeblock(code)}```{page_number}",
                 timestamp=ctx.message.created_at,
             )
             .set_author(name=ctx.author.name, icon_url=ctx.author.display_avatar.url)
@@ -119,14 +259,19 @@ class EmbedFactory:
 
 async def get_info(file_: File | disnake.Attachment) -> str:
     if isinstance(file_, disnake.Attachment):
-        real_file = file_
-    else:
-        real_file = await file_.to_real()
+        return (
+            f"Opened file: {file_.filename}"
+            f"\nType: {file_.content_type}"
+            f"\nSize: {file_.size // 1000} KB ({file_.size:,} bytes)"
+        )
 
+    if file_.size is None:
+        await file_.load()
     return (
-        f"Opened file: {real_file.filename}"
-        f"\nType: {real_file.content_type}"
-        f"\nSize: {real_file.size // 1000} KB ({real_file.size:,} bytes)"
+        f"Opened file: {file_.filename}"
+        f"\nType: {file_.content_type}"
+        f"\nSize: {file_.size // 1000} KB ({file_.size:,} bytes)"
+        f"\nLines: {file_.line_count:,}"
     )
 
 